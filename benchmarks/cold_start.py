@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Cold-start benchmark: wall time from a fresh interpreter to the first useful
+result for each kind of process that loads the CRM code.
+
+    python benchmarks/cold_start.py --repeat 5 --settings crm.settings --json out.json
+
+Targets:
+  manage   ``manage.py check``
+  celery   Celery app finalized with every task module imported (worker boot)
+  wsgi     WSGI app answering its first ``{ hello }`` POST to /graphql
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CELERY_SNIPPET = """
+import django
+django.setup()
+from crm.celery import app
+app.loader.import_default_modules()
+app.finalize()
+assert "crm.tasks.generate_crm_report" in app.tasks
+"""
+
+WSGI_SNIPPET = """
+import io, json
+from graphql_crm.wsgi import application
+body = json.dumps({"query": "{ hello }"}).encode()
+environ = {
+    "REQUEST_METHOD": "POST", "PATH_INFO": "/graphql", "SERVER_NAME": "localhost",
+    "SERVER_PORT": "80", "wsgi.url_scheme": "http", "wsgi.input": io.BytesIO(body),
+    "CONTENT_TYPE": "application/json", "CONTENT_LENGTH": str(len(body)),
+    "HTTP_ACCEPT": "application/json",
+}
+status = []
+chunks = application(environ, lambda s, h, exc_info=None: status.append(s))
+payload = b"".join(chunks)
+assert status[0].startswith("200"), (status, payload)
+"""
+
+
+def targets():
+    return {
+        "manage": [sys.executable, str(ROOT / "manage.py"), "check"],
+        "celery": [sys.executable, "-c", CELERY_SNIPPET],
+        "wsgi": [sys.executable, "-c", WSGI_SNIPPET],
+    }
+
+
+def time_once(cmd, env):
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(cmd[:3])} failed:\n{proc.stderr[-2000:]}")
+    return elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--settings", default=os.environ.get("DJANGO_SETTINGS_MODULE", "crm.settings"))
+    parser.add_argument("--only", choices=sorted(targets()), action="append")
+    parser.add_argument("--json", dest="json_path", help="Write results to this file.")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=args.settings, CELERY_BROKER_URL="memory://")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT), env.get("PYTHONPATH")]))
+
+    results = {}
+    for name, cmd in targets().items():
+        if args.only and name not in args.only:
+            continue
+        samples = [time_once(cmd, env) for _ in range(args.repeat)]
+        results[name] = {
+            "min_s": round(min(samples), 4),
+            "median_s": round(statistics.median(samples), 4),
+            "max_s": round(max(samples), 4),
+            "samples": [round(s, 4) for s in samples],
+        }
+        print(f"{name:<8} min {min(samples) * 1000:8.1f} ms   median {statistics.median(samples) * 1000:8.1f} ms")
+
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+"""
+Reproducible load benchmarks for the CRM GraphQL API and background jobs.
+
+Runs against a throw-away test database populated by ``seed_db.generate``:
+
+    python benchmarks/run.py --scale small --json results.json
+    python benchmarks/run.py --scale small --save-baseline benchmarks/baseline.json
+    python benchmarks/run.py --scale small --baseline benchmarks/baseline.json --tolerance 0.25
+
+Each scenario records latency percentiles, SQL queries per operation and
+throughput. With ``--baseline`` the run is compared against a saved result
+and the script exits non-zero on regressions.
+"""
+import abc
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("CELERY_BROKER_URL", "memory://")
+os.environ.setdefault("CELERY_TASK_ALWAYS_EAGER", "1")
+os.environ.setdefault("CELERY_RESULT_BACKEND", "cache+memory://")
+
+import django  # noqa: E402
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "crm.settings")
+django.setup()
+
+from django.db import connection, connections  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_test_environment  # noqa: E402
+
+
+# ------------------------
+# Scenarios
+# ------------------------
+class Scenario(abc.ABC):
+    """One benchmarked operation. ``run(i)`` executes iteration ``i``."""
+
+    name = None
+    iterations = 50
+    concurrency = 1
+
+    def setup(self, ctx):
+        pass
+
+    @abc.abstractmethod
+    def run(self, i):
+        """Execute iteration ``i``."""
+
+
+def execute(query, variables=None):
+    from graphql_crm.schema import get_schema
+
+    result = get_schema().execute(query, variables=variables)
+    if result.errors:
+        raise RuntimeError(result.errors)
+    return result.data
+
+
+class FilterCustomers(Scenario):
+    name = "filter_customers"
+
+    def run(self, i):
+        execute(
+            """query($min: Decimal) {
+                customers(first: 50, lifetimeValue_Gte: $min, orderBy: "-lifetime_value") {
+                    totalCount edges { node { id name email orderCount lifetimeValue } }
+                }
+            }""",
+            {"min": str((i % 10) * 50)},
+        )
+
+
+class FilterProducts(Scenario):
+    name = "filter_products"
+
+    def run(self, i):
+        execute(
+            """query($max: Decimal) {
+                products(first: 50, price_Lte: $max, stock_Gte: 1) { totalCount edges { node { id name price stock } } }
+            }""",
+            {"max": str(100 + i * 10)},
+        )
+
+
+class NestedOrders(Scenario):
+    name = "nested_orders"
+
+    def run(self, i):
+        execute(
+            """query($after: String) {
+                orders(first: 100, after: $after) {
+                    edges { node { id totalAmount orderDate customer { id name email } products { id name price } } }
+                }
+            }""",
+            {"after": None},
+        )
+
+
+class BulkCreateCustomers(Scenario):
+    name = "bulk_create_customers"
+    iterations = 20
+    batch = 200
+
+    def run(self, i):
+        rows = [
+            {"name": f"Bench {i}-{n}", "email": f"bench-{os.getpid()}-{i}-{n}@example.com", "phone": "+12345678901"}
+            for n in range(self.batch)
+        ]
+        execute(
+            "mutation($input: [CreateCustomerInput]!) { bulkCreateCustomers(input: $input) { errors customers { id } } }",
+            {"input": rows},
+        )
+
+
+class ConcurrentCreateOrder(Scenario):
+    name = "concurrent_create_order"
+    iterations = 200
+    concurrency = 8
+
+    def setup(self, ctx):
+        from crm.models import Customer, Product
+
+        self.customer_ids = list(Customer.objects.values_list("id", flat=True)[:500])
+        self.product_ids = list(Product.objects.values_list("id", flat=True)[:200])
+
+    def run(self, i):
+        customer = self.customer_ids[i % len(self.customer_ids)]
+        products = [self.product_ids[(i * 7 + k) % len(self.product_ids)] for k in range(1 + i % 3)]
+        execute(
+            "mutation($c: ID!, $p: [ID]!) { createOrder(input: {customerId: $c, productIds: $p}) { errors order { id totalAmount } } }",
+            {"c": customer, "p": products},
+        )
+
+
+class Restock(Scenario):
+    name = "restock"
+    iterations = 10
+
+    def run(self, i):
+        from crm.models import Product
+
+        # Put a slice of the catalog back under the threshold so every iteration has work.
+        Product.objects.filter(id__in=Product.objects.order_by("id").values("id")[:500]).update(stock=1)
+        execute("mutation { updateLowStockProducts { success products { id stock } } }")
+
+
+class Report(Scenario):
+    name = "report"
+    iterations = 20
+
+    def run(self, i):
+        # Chunked fan-out, executed eagerly in this process.
+        from crm.tasks import generate_crm_report
+
+        generate_crm_report.apply()
+
+
+SCENARIOS = {cls.name: cls for cls in Scenario.__subclasses__()}
+
+
+# ------------------------
+# Measurement
+# ------------------------
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def measure(scenario, iterations):
+    latencies = []
+    queries = []
+    errors = []
+    lock = threading.Lock()
+
+    def one(i):
+        conn = connections["default"]
+        with CaptureQueriesContext(conn) as ctx:
+            start = time.perf_counter()
+            try:
+                scenario.run(i)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                return
+            elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            queries.append(len(ctx.captured_queries))
+
+    def worker(i):
+        try:
+            one(i)
+        finally:
+            connections.close_all()
+
+    scenario.run(-1)  # warm-up, not recorded
+    started = time.perf_counter()
+    if scenario.concurrency > 1:
+        with ThreadPoolExecutor(max_workers=scenario.concurrency) as pool:
+            list(pool.map(worker, range(iterations)))
+    else:
+        for i in range(iterations):
+            one(i)
+    wall = time.perf_counter() - started
+
+    if not latencies:
+        raise RuntimeError(f"{scenario.name}: every iteration failed, first error: {errors[0]}")
+    latencies.sort()
+    return {
+        "iterations": iterations,
+        "concurrency": scenario.concurrency,
+        "errors": len(errors),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 3),
+            "p90": round(percentile(latencies, 90) * 1000, 3),
+            "p99": round(percentile(latencies, 99) * 1000, 3),
+            "mean": round(statistics.fmean(latencies) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3),
+        },
+        "queries_per_op": round(statistics.fmean(queries), 2),
+        "max_queries": max(queries),
+        "throughput_ops": round(iterations / wall, 2),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of human-readable regressions versus ``baseline``."""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        if current.get("errors", 0) > previous.get("errors", 0):
+            regressions.append(f"{name}: errors {previous.get('errors', 0)} -> {current['errors']}")
+        if current["max_queries"] > previous["max_queries"]:
+            regressions.append(f"{name}: max queries {previous['max_queries']} -> {current['max_queries']}")
+        for key in ("p50", "p90"):
+            before, after = previous["latency_ms"][key], current["latency_ms"][key]
+            if before and after > before * (1 + tolerance):
+                regressions.append(f"{name}: {key} {before:.1f}ms -> {after:.1f}ms (+{(after / before - 1):.0%})")
+        before, after = previous["throughput_ops"], current["throughput_ops"]
+        if before and after < before * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before:.1f} -> {after:.1f} ops/s")
+    return regressions
+
+
+def main(argv=None):
+    import seed_db
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=sorted(k for k, v in seed_db.SCALES.items() if v), default="small")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="Run only these scenarios.")
+    parser.add_argument("--iterations", type=int, help="Override per-scenario iteration counts.")
+    parser.add_argument("--keepdb", action="store_true", help="Reuse an existing test database and its data.")
+    parser.add_argument("--json", dest="json_path", help="Write results to this file.")
+    parser.add_argument("--save-baseline", help="Write results as the new baseline to this file.")
+    parser.add_argument("--baseline", help="Compare against this baseline and fail on regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown (default 0.2).")
+    args = parser.parse_args(argv)
+
+    setup_test_environment()
+    if connection.vendor == "sqlite":
+        # The default in-memory test database serializes threads on a shared-cache
+        # table lock; a file database gives the concurrent scenarios real SQLite locking.
+        # Assigned, not setdefault(): Django has already filled in TEST["NAME"] = None.
+        connection.settings_dict["TEST"]["NAME"] = str(ROOT / "benchmarks" / "bench.sqlite3")
+    old_name = connection.creation.create_test_db(verbosity=0, keepdb=args.keepdb)
+    try:
+        from crm.models import Customer
+
+        if not Customer.objects.exists():
+            print(f"Generating '{args.scale}' dataset...")
+            seed_db.generate(**seed_db.SCALES[args.scale], verbose=False)
+
+        results = {
+            "scale": args.scale,
+            "python": platform.python_version(),
+            "database": connection.vendor,
+            "scenarios": {},
+        }
+        for name in args.scenario or SCENARIOS:
+            scenario = SCENARIOS[name]()
+            scenario.setup(results)
+            stats = measure(scenario, args.iterations or scenario.iterations)
+            results["scenarios"][name] = stats
+            lat = stats["latency_ms"]
+            print(f"{name:<24} p50 {lat['p50']:9.2f} ms  p90 {lat['p90']:9.2f} ms  p99 {lat['p99']:9.2f} ms  "
+                  f"{stats['queries_per_op']:6.1f} q/op  {stats['throughput_ops']:8.1f} ops/s  {stats['errors']} errors")
+
+        # Jobs buffer their JobRun rows; write them while the test database exists,
+        # not from atexit after it has been destroyed.
+        from crm import joblog
+
+        joblog.flush()
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=args.keepdb)
+
+    for path in filter(None, (args.json_path, args.save_baseline)):
+        Path(path).write_text(json.dumps(results, indent=2))
+
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+"""
+Response benchmarks for large list queries, through the ``/graphql`` view.
+
+    python benchmarks/serialization.py --rows 10000 --rows 100000 --json out.json
+
+- Scalar-only lists: the normal graphene path versus ``crm.fastpath``. Reports
+  wall time, response bytes/second and peak Python memory.
+- Orders with nested products: one JSON response versus ``@stream``/``@defer``
+  over ``multipart/mixed`` (``crm.incremental``). Reports time to the first
+  chunk, total time and peak Python memory.
+
+Peak memory is measured with tracemalloc on a separate run. Runs against a
+throw-away test database seeded by ``seed_db.generate``.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import django  # noqa: E402
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "crm.settings")
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from django.test.utils import override_settings, setup_test_environment  # noqa: E402
+
+QUERIES = {
+    "orders": "query($n: Int) { orders(first: $n) { totalCount edges { node { id totalAmount orderDate } } } }",
+    "products": "query($n: Int) { products(first: $n) { totalCount edges { node { id name price stock } } } }",
+}
+
+NESTED = {
+    "json": "query($n: Int) { orders(first: $n) { totalCount edges { node { id totalAmount orderDate "
+            "products { id name price } } } } }",
+    "multipart": "query($n: Int) { orders(first: $n) { totalCount edges @stream(initialCount: 100) { node { id "
+                 "totalAmount orderDate ... @defer { products { id name price } } } } } }",
+}
+
+
+def request_once(view, query, rows, accept="application/json"):
+    request = RequestFactory().post(
+        "/graphql", json.dumps({"query": query, "variables": {"n": rows}}), content_type="application/json",
+        HTTP_ACCEPT=accept,
+    )
+    response = view(request)
+    assert response.status_code == 200, response.content[:500]
+    return response.content
+
+
+def measure(view, query, rows, repeat, fast):
+    with override_settings(CRM_GRAPHQL_FAST_PATH=fast):
+        body = request_once(view, query, rows)  # warm-up
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = request_once(view, query, rows)
+            timings.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        request_once(view, query, rows)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    seconds = statistics.median(timings)
+    (connection_data,) = json.loads(body)["data"].values()
+    returned = len(connection_data["edges"])
+    return {
+        "rows": returned,
+        "seconds": round(seconds, 4),
+        "bytes": len(body),
+        "mb_per_s": round(len(body) / seconds / 1e6, 2),
+        "rows_per_s": round(returned / seconds),
+        "peak_mb": round(peak / 1e6, 2),
+    }, body
+
+
+def stream_once(view, query, rows, accept):
+    """``(seconds to first chunk, total seconds, bytes)``; chunks are counted, not kept."""
+    start = time.perf_counter()
+    response = view(RequestFactory().post(
+        "/graphql", json.dumps({"query": query, "variables": {"n": rows}}), content_type="application/json",
+        HTTP_ACCEPT=accept,
+    ))
+    assert response.status_code == 200
+    chunks = iter(response.streaming_content if response.streaming else [response.content])
+    size = len(next(chunks))
+    first = time.perf_counter() - start
+    size += sum(len(chunk) for chunk in chunks)
+    response.close()
+    return first, time.perf_counter() - start, size
+
+
+def measure_incremental(view, rows, repeat, mode):
+    accept = "multipart/mixed, application/json" if mode == "multipart" else "application/json"
+    stream_once(view, NESTED[mode], rows, accept)  # warm-up
+    runs = [stream_once(view, NESTED[mode], rows, accept) for _ in range(repeat)]
+
+    tracemalloc.start()
+    stream_once(view, NESTED[mode], rows, accept)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "ttfb_seconds": round(statistics.median(r[0] for r in runs), 4),
+        "seconds": round(statistics.median(r[1] for r in runs), 4),
+        "bytes": runs[-1][2],
+        "peak_mb": round(peak / 1e6, 2),
+    }
+
+
+def main(argv=None):
+    import seed_db
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, action="append", help="Rows per response (default 10000 and 100000).")
+    parser.add_argument("--resource", action="append", choices=sorted(QUERIES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--keepdb", action="store_true", help="Reuse an existing test database and its data.")
+    parser.add_argument("--json", dest="json_path", help="Write results to this file.")
+    args = parser.parse_args(argv)
+    row_counts = sorted(args.rows or [10_000, 100_000])
+
+    # Listings cap `first` at CRM_GRAPHQL_MAX_ROWS; the fields read it when the schema is built.
+    from django.conf import settings
+
+    override_settings(CRM_GRAPHQL_MAX_ROWS=max(settings.CRM_GRAPHQL_MAX_ROWS, *row_counts)).enable()
+    from graphql_crm.schema import get_schema
+    from crm.views import CRMGraphQLView
+
+    view = CRMGraphQLView.as_view(schema=get_schema())
+
+    setup_test_environment()
+    if connection.vendor == "sqlite":
+        # Assigned, not setdefault(): Django has already filled in TEST["NAME"] = None.
+        connection.settings_dict["TEST"]["NAME"] = str(ROOT / "benchmarks" / "serialization.sqlite3")
+    old_name = connection.creation.create_test_db(verbosity=0, keepdb=args.keepdb)
+    results = {"database": connection.vendor, "resources": {}}
+    try:
+        from crm.models import Order, Product
+
+        if not Order.objects.exists():
+            print("Generating dataset...")
+            # ~3 orders per customer on average, so this leaves some headroom over the largest count.
+            seed_db.generate(customers=max(row_counts) // 2, products=max(row_counts), verbose=False)
+        print(f"{Order.objects.count()} orders, {Product.objects.count()} products")
+
+        for resource in args.resource or sorted(QUERIES):
+            for rows in row_counts:
+                normal, normal_body = measure(view, QUERIES[resource], rows, args.repeat, fast=False)
+                fast, fast_body = measure(view, QUERIES[resource], rows, args.repeat, fast=True)
+                assert json.loads(normal_body) == json.loads(fast_body), f"{resource}: fast path output differs"
+                results["resources"].setdefault(resource, []).append({"normal": normal, "fast": fast})
+                for label, stats in (("graphene", normal), ("fastpath", fast)):
+                    print(f"{resource:<9} {stats['rows']:>7} rows  {label:<8}  {stats['seconds'] * 1000:9.1f} ms  "
+                          f"{stats['bytes'] / 1e6:7.2f} MB  {stats['mb_per_s']:7.2f} MB/s  "
+                          f"{stats['rows_per_s']:>9} rows/s  peak {stats['peak_mb']:8.2f} MB")
+
+        for rows in row_counts:
+            for mode in ("json", "multipart"):
+                stats = measure_incremental(view, rows, args.repeat, mode)
+                results.setdefault("incremental", {}).setdefault(mode, []).append({"rows": rows, **stats})
+                print(f"nested    {rows:>7} rows  {mode:<9} first chunk {stats['ttfb_seconds'] * 1000:9.1f} ms  "
+                      f"total {stats['seconds'] * 1000:9.1f} ms  {stats['bytes'] / 1e6:7.2f} MB  "
+                      f"peak {stats['peak_mb']:8.2f} MB")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=args.keepdb)
+
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Archival of old orders.
+
+``archive_range`` moves orders placed before a cutoff from ``Order`` and
+``crm_order_products`` to ``ArchivedOrder`` and its product table. It works
+in ID-ordered batches with one transaction per batch, so live filters and
+reports only scan recent rows. Customer aggregates stay as they are, since
+archived orders still count towards ``order_count`` and ``lifetime_value``.
+
+``crm.tasks.archive_old_orders`` fans this out over ID ranges;
+``manage.py archive_orders`` runs it inline. ``orders(includeArchived: true)``
+reads both tables through ``ArchiveChain``.
+"""
+import logging
+from datetime import timedelta
+from itertools import chain
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedOrder, Order
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HORIZON_DAYS = 365
+DEFAULT_BATCH_SIZE = 1000
+
+
+def cutoff(days=None, now=None):
+    """Orders placed before this are archived; ``CRM_ORDER_ARCHIVE_DAYS`` ago by default."""
+    days = getattr(settings, "CRM_ORDER_ARCHIVE_DAYS", DEFAULT_HORIZON_DAYS) if days is None else days
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def archive_range(before, start_id=None, end_id=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Archive orders dated before ``before``, optionally only IDs in
+    ``[start_id, end_id]``. Yields the number of orders moved per batch.
+    Safe to re-run: moved orders are no longer in ``Order``. An order whose
+    ID is already taken by a different archived order stays in ``Order``
+    and is logged.
+    """
+    OrderProducts = Order.products.through
+    ArchivedProducts = ArchivedOrder.products.through
+
+    old = Order.objects.filter(order_date__lt=before)
+    if end_id is not None:
+        old = old.filter(id__lte=end_id)
+    last_id = (start_id or 1) - 1
+    while True:
+        with transaction.atomic():
+            rows = list(
+                old.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", "customer_id", "total_amount", "order_date")[:batch_size]
+            )
+            if not rows:
+                return
+            last_id = rows[-1][0]
+
+            # An ID already in ArchivedOrder is only dropped from Order if the archived copy is the same order.
+            taken = {
+                row[0]: row[1:]
+                for row in ArchivedOrder.objects.filter(id__in=[row[0] for row in rows])
+                .values_list("id", "customer_id", "total_amount", "order_date")
+            }
+            conflicts = [row[0] for row in rows if taken.get(row[0], row[1:]) != row[1:]]
+            if conflicts:
+                logger.warning("Not archiving orders %s: a different archived order has the same ID", conflicts)
+                rows = [row for row in rows if taken.get(row[0], row[1:]) == row[1:]]
+            ids = [row[0] for row in rows]
+
+            ArchivedOrder.objects.bulk_create([
+                ArchivedOrder(id=oid, customer_id=customer_id, total_amount=total, order_date=order_date)
+                for oid, customer_id, total, order_date in rows
+                if oid not in taken
+            ])
+            ArchivedProducts.objects.bulk_create(
+                [
+                    ArchivedProducts(archivedorder_id=oid, product_id=pid)
+                    for oid, pid in OrderProducts.objects.filter(order_id__in=ids).values_list("order_id", "product_id")
+                ],
+                ignore_conflicts=True,  # links of orders that were already archived
+            )
+            # Also removes the crm_order_products rows.
+            Order.objects.filter(id__in=ids).delete()
+        yield len(ids)
+
+
+class ArchiveChain:
+    """
+    Read-only sequence of live orders followed by archived ones, for the
+    ``orders`` connection. Slicing is lazy and maps onto each queryset, so
+    a page costs at most one query per table.
+    """
+
+    def __init__(self, live, archived, live_count=None):
+        self.live = live
+        self.archived = archived
+        self._live_count = live_count
+
+    def live_count(self):
+        if self._live_count is None:
+            self._live_count = self.live.count()
+        return self._live_count
+
+    def __len__(self):
+        return self.live_count() + self.archived.count()
+
+    def __iter__(self):
+        return chain(self.live, self.archived)
+
+    def iterator(self, chunk_size=None):
+        """Stream both tables from database cursors, like ``QuerySet.iterator``."""
+        return chain(self.live.iterator(chunk_size=chunk_size), self.archived.iterator(chunk_size=chunk_size))
+
+    def prefetch_related(self, *lookups):
+        """``QuerySet.prefetch_related`` on both tables; ``None`` clears the lookups."""
+        return ArchiveChain(
+            self.live.prefetch_related(*lookups), self.archived.prefetch_related(*lookups), self._live_count
+        )
+
+    @property
+    def prefetch_lookups(self):
+        return self.live._prefetch_related_lookups
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            n = self.live_count()
+            return self.live[item] if item < n else self.archived[item - n]
+        if item.step is not None:
+            raise ValueError("ArchiveChain does not support slice steps")
+
+        n = self.live_count()
+        start = item.start or 0
+        live_start = min(start, n)
+        live_stop = n if item.stop is None else min(item.stop, n)
+        archived_start = max(start - n, 0)
+        archived_stop = None if item.stop is None else max(item.stop - n, archived_start)
+        return ArchiveChain(
+            self.live[live_start:live_stop],
+            self.archived[archived_start:archived_stop],
+            live_count=max(live_stop - live_start, 0),
+        )
+
+    def aggregate(self, **aggregates):
+        """Sum each aggregate across both tables (for Sum/Count)."""
+        live, archived = self.live.aggregate(**aggregates), self.archived.aggregate(**aggregates)
+        return {
+            key: None if live[key] is None and archived[key] is None else (live[key] or 0) + (archived[key] or 0)
+            for key in aggregates
+        }
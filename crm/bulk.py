@@ -0,0 +1,81 @@
+"""
+Batch operations shared by the synchronous GraphQL mutations and the Celery
+job tasks in ``crm.tasks``.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import catalog
+from .models import Customer, Product
+from .pubsub import PRODUCT_STOCK_CHANGED, publish
+from .validation import RowError, customer_validator, product_validator
+
+
+def bulk_create_customers(rows, start=1):
+    """
+    Validate and insert ``rows`` (dicts with name/email/phone).
+    Returns ``(created_customers, row_errors)``; ``start`` numbers rows in errors.
+    """
+    result = customer_validator.validate(rows, start=start)
+    try:
+        with transaction.atomic():
+            created = Customer.objects.bulk_create(Customer(**data) for data in result.cleaned)
+    except IntegrityError:
+        # An email was taken by a concurrent insert after validation; find it row by row.
+        created = []
+        for idx, data in result.valid:
+            try:
+                with transaction.atomic():
+                    created.append(Customer.objects.create(**data))
+            except IntegrityError:
+                result.errors.append(RowError(idx, "email", "Email already exists", data["email"]))
+        result.errors.sort(key=lambda e: e.row)
+    return created, result.errors
+
+
+def bulk_create_products(rows, start=1):
+    """Validate and insert ``rows`` (dicts with name/price/stock); same contract as above."""
+    result = product_validator.validate(rows, start=start)
+    with transaction.atomic():
+        created = Product.objects.bulk_create(Product(**data) for data in result.cleaned)
+    return created, result.errors
+
+
+def restock_low_stock(threshold=10, amount=10, batch_size=500, start_id=None, end_id=None):
+    """
+    Add ``amount`` to every product below ``threshold`` in ID-ordered batches,
+    optionally limited to IDs in ``[start_id, end_id]``.
+    Yields the restocked ``(id, name, new_stock)`` tuples per batch.
+    """
+    low_stock = Product.objects.filter(stock__lt=threshold)
+    if end_id is not None:
+        low_stock = low_stock.filter(id__lte=end_id)
+    last_id = (start_id or 1) - 1
+    while True:
+        batch = list(
+            low_stock.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "name", "stock")[:batch_size]
+        )
+        if not batch:
+            return
+        last_id = batch[-1][0]
+        ids = [pid for pid, _, _ in batch]
+
+        with transaction.atomic():
+            Product.objects.filter(id__in=ids).update(stock=F("stock") + amount, updated_at=timezone.now())
+            # QuerySet.update() skips post_save, so publish stock changes explicitly.
+            for pid, name, stock in batch:
+                payload = {"id": pid, "name": name, "stock": stock + amount, "previous_stock": stock}
+                transaction.on_commit(lambda p=payload: publish(PRODUCT_STOCK_CHANGED, p, key=p["id"]))
+            transaction.on_commit(lambda b=batch: _apply_restock(b, amount))
+
+        yield [(pid, name, stock + amount) for pid, name, stock in batch]
+
+
+def _apply_restock(batch, amount):
+    snapshot = catalog.loaded_catalog()
+    if snapshot is not None:
+        for pid, _, stock in batch:
+            snapshot.set_stock(pid, stock + amount)
@@ -0,0 +1,190 @@
+"""
+In-process snapshot of product prices and stock.
+
+The snapshot keeps three parallel ``array('q')`` columns sorted by product
+ID (price in cents), about 24 bytes per product, and a ``version`` that bumps
+on every change. Commits in this process update it through the Product
+signals and ``restock_low_stock``. Changes from other processes are applied
+incrementally from ``Product.updated_at`` at most every ``CRM_CATALOG_TTL``
+seconds. A full reload only happens when rows were deleted.
+
+``CRM_CATALOG_MAX_BYTES`` bounds the snapshot. A catalog larger than the
+budget keeps the lowest IDs, and lookups read the rest from the database.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Product
+
+CENTS = Decimal("0.01")
+ENTRY_BYTES = 3 * array("q").itemsize
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024   # ~700k products
+DEFAULT_TTL = 5                        # seconds between refreshes from the database
+# updated_at is stamped at save time, not commit time; re-read this far back so
+# slow transactions that commit after a refresh are not missed.
+DEFAULT_LAG = 60
+
+
+def to_cents(price):
+    return int(price * 100)
+
+
+class CatalogSnapshot:
+    def __init__(self, max_bytes=None):
+        max_bytes = max_bytes or getattr(settings, "CRM_CATALOG_MAX_BYTES", DEFAULT_MAX_BYTES)
+        self.max_entries = max_bytes // ENTRY_BYTES
+        self.ids = array("q")
+        self.prices = array("q")
+        self.stocks = array("q")
+        self.version = 0
+        self.complete = False   # every product fits in the budget
+        self.loaded_at = None   # wall-clock start of the last load/refresh
+        self.checked_at = None  # monotonic time of the last load/refresh
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        return len(self.ids) * ENTRY_BYTES
+
+    # ------------------------
+    # Loading
+    # ------------------------
+    def load(self):
+        """Replace the snapshot with the current table, up to the memory budget."""
+        started = timezone.now()
+        ids, prices, stocks = array("q"), array("q"), array("q")
+        rows = (
+            Product.objects.order_by("id")
+            .values_list("id", "price", "stock")[:self.max_entries + 1]
+            .iterator(chunk_size=5000)
+        )
+        complete = True
+        for pid, price, stock in rows:
+            if len(ids) == self.max_entries:
+                complete = False
+                break
+            ids.append(pid)
+            prices.append(to_cents(price))
+            stocks.append(stock)
+
+        with self._lock:
+            self.ids, self.prices, self.stocks = ids, prices, stocks
+            self.complete = complete
+            self.loaded_at = started
+            self.checked_at = time.monotonic()
+            self.version += 1
+
+    def refresh(self):
+        """Apply products saved since the last refresh; reload if rows were deleted elsewhere."""
+        if self.loaded_at is None:
+            return self.load()
+        started = timezone.now()
+        lag = timedelta(seconds=getattr(settings, "CRM_CATALOG_LAG", DEFAULT_LAG))
+        changed = Product.objects.filter(updated_at__gte=self.loaded_at - lag).values_list("id", "price", "stock")
+        for pid, price, stock in changed:
+            self.put(pid, price, stock)
+        if self.complete and Product.objects.count() != len(self):
+            return self.load()
+        with self._lock:
+            self.loaded_at = started
+            self.checked_at = time.monotonic()
+
+    def refresh_if_stale(self):
+        ttl = getattr(settings, "CRM_CATALOG_TTL", DEFAULT_TTL)
+        if self.checked_at is None or time.monotonic() - self.checked_at >= ttl:
+            self.refresh()
+
+    # ------------------------
+    # Incremental changes
+    # ------------------------
+    def put(self, pid, price, stock):
+        with self._lock:
+            i = bisect_left(self.ids, pid)
+            if i < len(self.ids) and self.ids[i] == pid:
+                self.prices[i], self.stocks[i] = to_cents(price), stock
+            elif len(self.ids) < self.max_entries:
+                self.ids.insert(i, pid)
+                self.prices.insert(i, to_cents(price))
+                self.stocks.insert(i, stock)
+            else:
+                self.complete = False
+                return
+            self.version += 1
+
+    def set_stock(self, pid, stock):
+        with self._lock:
+            i = bisect_left(self.ids, pid)
+            if i < len(self.ids) and self.ids[i] == pid:
+                self.stocks[i] = stock
+                self.version += 1
+
+    def remove(self, pid):
+        with self._lock:
+            i = bisect_left(self.ids, pid)
+            if i < len(self.ids) and self.ids[i] == pid:
+                del self.ids[i], self.prices[i], self.stocks[i]
+                self.version += 1
+
+    # ------------------------
+    # Lookups
+    # ------------------------
+    def lookup(self, product_ids):
+        """``({id: (price, stock)}, missing_ids)`` from the snapshot alone."""
+        found, missing = {}, []
+        with self._lock:
+            for pid in product_ids:
+                i = bisect_left(self.ids, pid)
+                if i < len(self.ids) and self.ids[i] == pid:
+                    found[pid] = (Decimal(self.prices[i]) * CENTS, self.stocks[i])
+                else:
+                    missing.append(pid)
+        return found, missing
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = CatalogSnapshot()
+    return _catalog
+
+
+def loaded_catalog():
+    """The snapshot if this process has loaded one, else None (nothing to keep up to date)."""
+    return _catalog if _catalog is not None and _catalog.loaded_at is not None else None
+
+
+def reset():
+    global _catalog
+    _catalog = None
+
+
+def product_prices(product_ids):
+    """
+    ``{id: (price, stock)}`` for the given integer IDs; unknown IDs are absent.
+    One query at most: IDs outside the snapshot (over budget, or created
+    since the last refresh) are read from the database together.
+    """
+    catalog = get_catalog()
+    catalog.refresh_if_stale()
+    found, missing = catalog.lookup(product_ids)
+    if missing:
+        # Not written back: the rows may belong to an uncommitted transaction.
+        for pid, price, stock in Product.objects.filter(id__in=missing).values_list("id", "price", "stock"):
+            found[pid] = (price, stock)
+    return found
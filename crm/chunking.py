@@ -0,0 +1,80 @@
+"""
+Chunked fan-out for Celery jobs over large tables.
+
+A job splits its table into primary-key ranges with ``id_ranges``, runs one
+chunk task per range in parallel via a ``chord`` and merges the partial
+results in a single callback. Chunk tasks use ``CHUNK_RETRY`` so a chunk that
+hits a database error is retried on its own without re-running the others.
+
+    fan_out(chunk_signatures(my_chunk, Customer.objects.all()), my_merge.s())
+"""
+from decimal import Decimal
+
+from celery import chord
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Max, Min
+
+DEFAULT_CHUNK_SIZE = 10_000  # primary keys per chunk task; CRM_TASK_CHUNK_SIZE overrides
+
+# Options for chunk tasks: @shared_task(**CHUNK_RETRY)
+CHUNK_RETRY = {
+    "autoretry_for": (DatabaseError,),
+    "retry_backoff": True,
+    "retry_backoff_max": 60,
+    "retry_jitter": True,
+    "max_retries": 5,
+    "acks_late": True,
+}
+
+
+def chunk_size():
+    return getattr(settings, "CRM_TASK_CHUNK_SIZE", DEFAULT_CHUNK_SIZE)
+
+
+def id_ranges(queryset, size=None):
+    """Inclusive ``(lo, hi)`` primary-key ranges covering ``queryset``; empty if it has no rows."""
+    bounds = queryset.aggregate(lo=Min("pk"), hi=Max("pk"))
+    if bounds["lo"] is None:
+        return []
+    size = size or chunk_size()
+    return [(lo, min(lo + size - 1, bounds["hi"])) for lo in range(bounds["lo"], bounds["hi"] + 1, size)]
+
+
+def chunk_signatures(task, queryset, size=None, **kwargs):
+    """One ``task.s(lo, hi, **kwargs)`` per ID range of ``queryset``."""
+    return [task.s(lo, hi, **kwargs) for lo, hi in id_ranges(queryset, size)]
+
+
+def fan_out(signatures, callback, on_error=None):
+    """
+    Run ``signatures`` in parallel and call ``callback`` with the list of their
+    results. ``on_error`` is linked as the callback's errback, so it runs if a
+    chunk fails after exhausting its retries. Returns the AsyncResult.
+    """
+    if on_error is not None:
+        callback = callback.on_error(on_error)
+    if not signatures:
+        return callback.delay([])
+    return chord(signatures)(callback)
+
+
+def merge_totals(parts, decimal_keys=()):
+    """
+    Combine partial aggregates from chunk tasks: numbers are summed and lists
+    concatenated. Keys in ``decimal_keys`` are summed as Decimal (chunk tasks
+    return them as strings since Decimal isn't JSON-serializable) and returned
+    as strings.
+    """
+    totals = {}
+    for part in parts:
+        for key, value in (part or {}).items():
+            if key in decimal_keys:
+                totals[key] = totals.get(key, Decimal("0")) + Decimal(value)
+            elif isinstance(value, list):
+                totals.setdefault(key, []).extend(value)
+            else:
+                totals[key] = totals.get(key, 0) + value
+    for key in decimal_keys:
+        totals[key] = str(totals.get(key, Decimal("0.00")))
+    return totals
@@ -1,45 +1,58 @@
-import datetime
-import asyncio
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+import logging
+import time
 
+from django.conf import settings
 
-def log_crm_heartbeat():
-    now = datetime.datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
-    message = f"{now} CRM is alive\n"
+logger = logging.getLogger(__name__)
 
-    with open("/tmp/crm_heartbeat_log.txt", "a") as log_file:
-        log_file.write(message)
+HEARTBEAT_HISTORY = 12  # previous heartbeats the current latency is compared against
 
-        # Run optional GraphQL hello query
-        try:
-            asyncio.run(query_graphql_hello(log_file, now))
-        except Exception as e:
-            log_file.write(f"{now} GraphQL check failed: {e}\n")
 
+def log_crm_heartbeat():
+    """Poll /readyz and record the result, alerting when latency trends well above recent runs."""
+    import requests
 
-async def query_graphql_hello(log_file, now):
-    transport = RequestsHTTPTransport(
-        url="http://localhost:8000/graphql",
-        verify=True,
-        retries=3,
-    )
-    client = Client(transport=transport, fetch_schema_from_transport=True)
+    from .health import latency_alert
+    from .joblog import job_run
+    from .models import JobRun
 
-    query = gql("{ hello }")
-    result = await client.execute_async(query)
+    url = getattr(settings, "CRM_HEALTH_URL", "http://localhost:8000/readyz")
+    with job_run("crm_heartbeat") as run:
+        started = time.perf_counter()
+        try:
+            response = requests.get(url, timeout=5)
+            report = response.json()
+        except (requests.RequestException, ValueError) as e:
+            run.fail(f"Health check failed: {e}")
+            return
+
+        run.details = {
+            "status": report.get("status"),
+            "http_ms": round((time.perf_counter() - started) * 1000, 3),
+            "db_latency_ms": report.get("database", {}).get("latency_ms"),
+            "queue_depth": report.get("queue", {}).get("depth"),
+        }
+        if response.status_code != 200:
+            run.fail(f"{url} returned {response.status_code}: {report}")
+            return
+
+        history = list(
+            JobRun.objects.filter(name="crm_heartbeat", status=JobRun.SUCCEEDED)
+            .values_list("details", flat=True)[:HEARTBEAT_HISTORY]
+        )
+        for key in ("http_ms", "db_latency_ms"):
+            alert = latency_alert([details.get(key) for details in history], run.details[key])
+            if alert:
+                logger.warning("CRM heartbeat %s: %s", key, alert)
+                run.error(f"{key}: {alert}")
 
-    log_file.write(f"{now} GraphQL hello response: {result}\n")
 
 def update_low_stock():
-    now = datetime.datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
-    with open("/tmp/low_stock_updates_log.txt", "a") as log_file:
-        try:
-            result = asyncio.run(run_update_mutation())
-            products = result.get("updateLowStockProducts", {}).get("products", [])
-            for product in products:
-                log_file.write(
-                    f"{now} - Updated {product['name']} to stock {product['stock']}\n"
-                )
-        except Exception as e:
-            log_file.write(f"{now} - Error updating low stock: {e}\n")
+    from .bulk import restock_low_stock
+    from .joblog import job_run
+
+    with job_run("update_low_stock") as run:
+        for batch in restock_low_stock():
+            run.rows += len(batch)
+            for product_id, name, stock in batch:
+                run.item(id=product_id, name=name, stock=stock)
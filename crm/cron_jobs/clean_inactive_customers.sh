@@ -3,18 +3,13 @@
 # Navigate to the project root (adjust if needed)
 cd "$(dirname "$0")/../.."
 
-# Run Django shell command to delete customers inactive for 1 year
-deleted_count=$(python3 manage.py shell -c "
-from django.utils import timezone
-from datetime import timedelta
-from crm.models import Customer
-
-cutoff = timezone.now() - timedelta(days=365)
-qs = Customer.objects.filter(orders__isnull=True, created_at__lt=cutoff)
-count = qs.count()
-qs.delete()
-print(count)
+# Queue the chunked cleanup task (crm.tasks.clean_inactive_customers). Celery beat
+# already runs it weekly; use this where beat isn't deployed or to run it now.
+# Deleted counts are recorded as a clean_inactive_customers job run.
+task_id=$(python3 manage.py shell -c "
+from crm.tasks import clean_inactive_customers
+print(clean_inactive_customers.delay(days=365).id)
 ")
 
 # Log output with timestamp
-echo \"\$(date '+%Y-%m-%d %H:%M:%S') - Deleted \$deleted_count inactive customers\" >> /tmp/customer_cleanup_log.txt
+echo "$(date '+%Y-%m-%d %H:%M:%S') - Queued inactive customer cleanup (task $task_id)" >> /tmp/customer_cleanup_log.txt
@@ -1,48 +1,40 @@
 #!/usr/bin/env python3
 
-import asyncio
-from datetime import datetime, timedelta
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
-
-async def main():
-    # GraphQL endpoint
-    transport = RequestsHTTPTransport(
-        url="http://localhost:8000/graphql",
-        verify=True,
-        retries=3,
-    )
-    client = Client(transport=transport, fetch_schema_from_transport=True)
+import os
+import sys
+from datetime import timedelta
+from pathlib import Path
 
-    # Date range: last 7 days
-    cutoff_date = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
-
-    # GraphQL query
-    query = gql(
-        """
-        query getRecentOrders($cutoff: Date!) {
-            orders(filter: {orderDate_Gte: $cutoff, status: "PENDING"}) {
-                id
-                customer {
-                    email
-                }
-            }
-        }
-        """
-    )
-
-    # Execute query
-    result = await client.execute_async(query, variable_values={"cutoff": cutoff_date})
-    orders = result.get("orders", [])
-
-    # Log results
-    with open("/tmp/order_reminders_log.txt", "a") as log_file:
-        for order in orders:
-            log_file.write(
-                f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - Order {order['id']} for {order['customer']['email']}\n"
-            )
+import django
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "crm.settings")
+django.setup()
+
+from django.utils import timezone  # noqa: E402
+
+from crm.joblog import flush, job_run  # noqa: E402
+from crm.models import Order  # noqa: E402
 
+
+def main():
+    # Date range: last 7 days
+    cutoff = timezone.now() - timedelta(days=7)
+
+    with job_run("send_order_reminders") as run:
+        reminders = (
+            Order.objects.filter(order_date__gte=cutoff)
+            .values_list("id", "customer__email")
+            .iterator(chunk_size=2000)
+        )
+        for order_id, email in reminders:
+            run.rows += 1
+            run.item(order=order_id, email=email)
+
+    # Short-lived process: write the run now rather than waiting for the buffer.
+    flush()
     print("Order reminders processed!")
 
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
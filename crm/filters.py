@@ -1,5 +1,5 @@
 import django_filters
-from .models import Customer, Product, Order
+from .models import Customer, Product, Order, ArchivedOrder, JobRun
 
 class CustomerFilter(django_filters.FilterSet):
     name = django_filters.CharFilter(field_name='name', lookup_expr='icontains')
@@ -7,14 +7,28 @@ class CustomerFilter(django_filters.FilterSet):
     created_at__gte = django_filters.DateFilter(field_name='created_at', lookup_expr='gte')
     created_at__lte = django_filters.DateFilter(field_name='created_at', lookup_expr='lte')
     phone_pattern = django_filters.CharFilter(method='filter_phone_pattern')
+    order_count__gte = django_filters.NumberFilter(field_name='order_count', lookup_expr='gte')
+    order_count__lte = django_filters.NumberFilter(field_name='order_count', lookup_expr='lte')
+    lifetime_value__gte = django_filters.NumberFilter(field_name='lifetime_value', lookup_expr='gte')
+    lifetime_value__lte = django_filters.NumberFilter(field_name='lifetime_value', lookup_expr='lte')
+    last_order_at__gte = django_filters.DateFilter(field_name='last_order_at', lookup_expr='gte')
+    last_order_at__lte = django_filters.DateFilter(field_name='last_order_at', lookup_expr='lte')
+    has_orders = django_filters.BooleanFilter(method='filter_has_orders')
+    order_by = django_filters.OrderingFilter(
+        fields=('name', 'email', 'created_at', 'order_count', 'lifetime_value', 'last_order_at')
+    )
 
     class Meta:
         model = Customer
-        fields = ['name', 'email', 'created_at']
+        fields = ['name', 'email', 'created_at', 'order_count', 'lifetime_value', 'last_order_at']
 
     def filter_phone_pattern(self, queryset, name, value):
         return queryset.filter(phone__startswith=value)
 
+    def filter_has_orders(self, queryset, name, value):
+        # Uses the denormalized counter instead of joining to Order.
+        return queryset.filter(order_count__gt=0) if value else queryset.filter(order_count=0)
+
 class ProductFilter(django_filters.FilterSet):
     name = django_filters.CharFilter(field_name='name', lookup_expr='icontains')
     price__gte = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
@@ -32,9 +46,29 @@ class OrderFilter(django_filters.FilterSet):
     order_date__gte = django_filters.DateFilter(field_name='order_date', lookup_expr='gte')
     order_date__lte = django_filters.DateFilter(field_name='order_date', lookup_expr='lte')
     customer_name = django_filters.CharFilter(field_name='customer__name', lookup_expr='icontains')
-    product_name = django_filters.CharFilter(field_name='product__name', lookup_expr='icontains')
-    product_id = django_filters.NumberFilter(field_name='product__id')
+    product_name = django_filters.CharFilter(field_name='products__name', lookup_expr='icontains', distinct=True)
+    product_id = django_filters.NumberFilter(field_name='products__id', distinct=True)
+    include_archived = django_filters.BooleanFilter(method='filter_include_archived')
 
     class Meta:
         model = Order
         fields = ['total_amount', 'order_date', 'customer_name', 'product_name', 'product_id']
+
+    def filter_include_archived(self, queryset, name, value):
+        # Read by the orders connection field, which appends ArchivedOrder rows.
+        return queryset
+
+class ArchivedOrderFilter(OrderFilter):
+    """Same filters applied to ArchivedOrder, for orders(includeArchived: true)."""
+
+    class Meta(OrderFilter.Meta):
+        model = ArchivedOrder
+
+class JobRunFilter(django_filters.FilterSet):
+    started_at__gte = django_filters.DateTimeFilter(field_name='started_at', lookup_expr='gte')
+    started_at__lte = django_filters.DateTimeFilter(field_name='started_at', lookup_expr='lte')
+    duration_ms__gte = django_filters.NumberFilter(field_name='duration_ms', lookup_expr='gte')
+
+    class Meta:
+        model = JobRun
+        fields = ['name', 'status', 'started_at', 'duration_ms']
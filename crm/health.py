@@ -0,0 +1,115 @@
+"""
+Liveness and readiness checks.
+
+``/healthz`` only reports whether the database answers; the probe result is
+cached in-process for ``CRM_HEALTH_DB_TTL`` seconds so frequent polling by a
+load balancer costs at most one ``SELECT 1`` per TTL per worker. ``/readyz``
+also reports DB latency, the cache round trip and the Celery queue depth, and
+fails when any of them is unavailable or the queue is deeper than
+``CRM_HEALTH_MAX_QUEUE_DEPTH``.
+"""
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+DEFAULT_DB_TTL = 5.0           # seconds a DB probe result is reused
+DEFAULT_MAX_QUEUE_DEPTH = 10_000
+
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+# ------------------------
+# Checks
+# ------------------------
+_db_probe = None
+_db_probe_lock = threading.Lock()
+
+
+def check_database(max_age=None):
+    """``{"ok", "latency_ms", "error"}`` from a cached ``SELECT 1``."""
+    global _db_probe
+    max_age = getattr(settings, "CRM_HEALTH_DB_TTL", DEFAULT_DB_TTL) if max_age is None else max_age
+    with _db_probe_lock:
+        if _db_probe is not None and time.monotonic() - _db_probe[0] < max_age:
+            return dict(_db_probe[1])
+
+        started = time.perf_counter()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+            result = {"ok": True, "latency_ms": _elapsed_ms(started), "error": None}
+        except Exception as e:
+            result = {"ok": False, "latency_ms": _elapsed_ms(started), "error": str(e)}
+        _db_probe = (time.monotonic(), result)
+        return dict(result)
+
+
+def check_cache():
+    started = time.perf_counter()
+    try:
+        token = str(time.time())
+        cache.set("crm-health", token, timeout=30)
+        ok = cache.get("crm-health") == token
+        return {"ok": ok, "latency_ms": _elapsed_ms(started), "error": None if ok else "read-back mismatch"}
+    except Exception as e:
+        return {"ok": False, "latency_ms": _elapsed_ms(started), "error": str(e)}
+
+
+def check_queue():
+    """Messages waiting in the default Celery queue, read with a passive declare on the broker."""
+    from .celery import app
+
+    queue = app.conf.task_default_queue
+    started = time.perf_counter()
+    try:
+        with app.connection_for_read() as conn:
+            conn.ensure_connection(max_retries=1)
+            try:
+                _, depth, consumers = conn.default_channel.queue_declare(queue=queue, passive=True)
+            except conn.channel_errors:
+                # Not declared yet: no worker has started and nothing was published.
+                depth, consumers = 0, 0
+        return {"ok": True, "queue": queue, "depth": depth, "consumers": consumers,
+                "latency_ms": _elapsed_ms(started), "error": None}
+    except Exception as e:
+        return {"ok": False, "queue": queue, "depth": None, "consumers": None,
+                "latency_ms": _elapsed_ms(started), "error": str(e)}
+
+
+def liveness():
+    database = check_database()
+    return {"status": "ok" if database["ok"] else "unavailable", "database": database}
+
+
+def readiness():
+    checks = {"database": check_database(), "cache": check_cache(), "queue": check_queue()}
+    max_depth = getattr(settings, "CRM_HEALTH_MAX_QUEUE_DEPTH", DEFAULT_MAX_QUEUE_DEPTH)
+    if checks["queue"]["ok"] and checks["queue"]["depth"] > max_depth:
+        checks["queue"]["ok"] = False
+        checks["queue"]["error"] = f"queue depth {checks['queue']['depth']} exceeds {max_depth}"
+    ready = all(check["ok"] for check in checks.values())
+    return {"status": "ready" if ready else "unavailable", **checks}
+
+
+# ------------------------
+# Trend alerts
+# ------------------------
+def latency_alert(history, current, factor=3.0, min_samples=6):
+    """
+    Message if ``current`` latency is more than ``factor`` times the median of
+    ``history`` (most recent first), else None. Needs ``min_samples`` of history.
+    """
+    history = [value for value in history if value is not None]
+    if current is None or len(history) < min_samples:
+        return None
+    baseline = statistics.median(history)
+    if baseline and current > baseline * factor:
+        return f"latency {current:.1f} ms is {current / baseline:.1f}x the median of the last {len(history)} ({baseline:.1f} ms)"
+    return None
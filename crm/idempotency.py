@@ -0,0 +1,188 @@
+"""
+Idempotency keys for creation mutations.
+
+The first request with a key claims it by inserting an IdempotencyRecord
+(the unique constraint on ``key`` decides the winner), runs the mutation and
+stores a JSON summary of the outcome. Retries, and duplicates that arrive
+while the first is still running, wait for that record and get the stored
+outcome back without executing anything.
+
+A claim holds a lease (``locked_until``) that is renewed in the background
+while the mutation runs, however long it takes. If the first request dies
+without finishing, renewals stop and its record is taken over once the lease
+runs out instead of blocking the key until it expires.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import IdempotencyRecord
+
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_LEASE = 60
+POLL_INTERVAL = 0.05
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyError(Exception):
+    pass
+
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+class _KeyLock:
+    """Per-key lock so same-process duplicates queue up instead of polling the database."""
+
+    def __init__(self, key):
+        self.key = key
+
+    def __enter__(self):
+        with _locks_guard:
+            lock, users = _locks.get(self.key, (None, 0))
+            lock = lock or threading.Lock()
+            _locks[self.key] = (lock, users + 1)
+        lock.acquire()
+
+    def __exit__(self, *exc):
+        with _locks_guard:
+            lock, users = _locks[self.key]
+            lock.release()
+            if users == 1:
+                del _locks[self.key]
+            else:
+                _locks[self.key] = (lock, users - 1)
+
+
+class _LeaseRenewal:
+    """Pushes a claim's ``locked_until`` forward every third of a lease until the block exits."""
+
+    def __init__(self, pk):
+        self.pk = pk
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"idempotency-lease-{pk}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        period = lease()
+        try:
+            while not self._stop.wait(period.total_seconds() / 3):
+                try:
+                    IdempotencyRecord.objects.filter(pk=self.pk, status=IdempotencyRecord.IN_PROGRESS).update(
+                        locked_until=timezone.now() + period
+                    )
+                except DatabaseError:
+                    logger.warning("Could not renew idempotency lease %s", self.pk, exc_info=True)
+        finally:
+            connection.close()  # this thread's connection
+
+
+def fingerprint(operation, payload):
+    body = json.dumps([operation, payload], sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def ttl():
+    return timedelta(seconds=getattr(settings, "CRM_IDEMPOTENCY_TTL", DEFAULT_TTL))
+
+
+def lease():
+    return timedelta(seconds=getattr(settings, "CRM_IDEMPOTENCY_LEASE", DEFAULT_LEASE))
+
+
+def run_idempotent(key, operation, payload, execute, wait_timeout=30):
+    """
+    Run ``execute()`` at most once per ``key``. ``execute`` returns
+    ``(value, stored)`` where ``stored`` is a JSON-serializable summary.
+
+    Returns ``(value, stored, replayed)``; ``value`` is None when replayed.
+    Raises IdempotencyError if the key was used for a different request or
+    the original request doesn't finish within ``wait_timeout`` seconds.
+    """
+    if not key:
+        value, stored = execute()
+        return value, stored, False
+
+    request_hash = fingerprint(operation, payload)
+    deadline = time.monotonic() + wait_timeout
+    with _KeyLock(key):
+        while True:
+            record, claimed = _claim(key, operation, request_hash)
+            if claimed:
+                break
+            if record is None:
+                continue  # released between our insert and our read
+            if record.request_hash != request_hash:
+                raise IdempotencyError("Idempotency key was already used for a different request")
+            record = _wait(record, deadline)
+            if record is not None:
+                return None, record.response, True
+            # The first request failed or its lease ran out; claim the key ourselves.
+
+        try:
+            with _LeaseRenewal(record.pk):
+                value, stored = execute()
+        except Exception:
+            # Let the client retry with the same key.
+            IdempotencyRecord.objects.filter(pk=record.pk).delete()
+            raise
+
+        IdempotencyRecord.objects.filter(pk=record.pk).update(
+            status=IdempotencyRecord.COMPLETED,
+            locked_until=None,
+            response=json.loads(json.dumps(stored, cls=DjangoJSONEncoder)),
+        )
+        return value, stored, False
+
+
+def _claim(key, operation, request_hash):
+    """``(record, True)`` if we claimed ``key``, else ``(holder, False)``; the holder is None if it just went away."""
+    now = timezone.now()
+    IdempotencyRecord.objects.filter(key=key).filter(
+        Q(expires_at__lte=now) | Q(status=IdempotencyRecord.IN_PROGRESS, locked_until__lte=now)
+    ).delete()
+    try:
+        with transaction.atomic():
+            record = IdempotencyRecord.objects.create(
+                key=key, operation=operation, request_hash=request_hash,
+                expires_at=now + ttl(), locked_until=now + lease(),
+            )
+        return record, True
+    except IntegrityError:
+        return IdempotencyRecord.objects.filter(key=key).first(), False
+
+
+def _wait(record, deadline):
+    """The completed record, or None if its owner failed or let the lease lapse."""
+    while record.status != IdempotencyRecord.COMPLETED:
+        if record.locked_until is not None and record.locked_until <= timezone.now():
+            return None
+        if time.monotonic() > deadline:
+            raise IdempotencyError("A request with this idempotency key is still in progress")
+        time.sleep(POLL_INTERVAL)
+        record = IdempotencyRecord.objects.filter(pk=record.pk).first()
+        if record is None:
+            return None
+    return record
+
+
+def purge_expired():
+    deleted, _ = IdempotencyRecord.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,362 @@
+"""
+Incremental delivery (``@defer`` / ``@stream``) for connection listings.
+
+graphql-core 3.2 has no incremental execution. ``execute`` implements the
+part the CRM listings need on top of its ``ExecutionContext``:
+
+    query {
+      orders(first: 5000) {
+        totalCount
+        edges @stream(initialCount: 50) {
+          node { id totalAmount ... @defer(label: "products") { products { id name } } }
+        }
+      }
+    }
+
+- ``@stream`` on the ``edges`` of a root connection field: the first payload
+  carries ``initialCount`` edges. The rest follow ``CRM_GRAPHQL_STREAM_BATCH``
+  rows at a time, read from a database cursor, so only one batch of model
+  instances is held at once.
+- ``@defer`` on fragments directly inside ``node``: those fields are resolved
+  for each batch after the batch's rows have been sent. Their prefetches
+  (e.g. ``products``) run at that point rather than for the initial query.
+- ``orders(includeArchived: true)`` streams live orders and then archived
+  ones, both from cursors, and prefetches per batch for each table.
+
+If resolving a later payload raises, the response ends with a final payload
+that carries the error and ``hasNext: false``, then the closing delimiter.
+
+Payloads use the ``incremental`` format: ``{"data", "hasNext"}`` first, then
+``{"incremental": [...], "hasNext"}``. They are sent as ``multipart/mixed``
+to clients that accept it. In any other case the usual single JSON response
+is returned; the directives are hints, and graphene ignores them. That covers
+clients without multipart support, directives placed elsewhere, and
+``last``/``before`` pagination.
+"""
+import logging
+from copy import copy
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import QuerySet, prefetch_related_objects
+from graphene.relay import PageInfo
+from graphene.utils.str_converters import to_snake_case
+from graphene_django.fields import DjangoConnectionField
+from graphql import (
+    DirectiveLocation, FieldNode, FragmentSpreadNode, GraphQLArgument, GraphQLBoolean, GraphQLDirective,
+    GraphQLError, GraphQLInt, GraphQLNonNull, GraphQLString, InlineFragmentNode, OperationType,
+    SelectionSetNode, get_named_type, parse, validate,
+)
+from graphql.execution import ExecutionContext
+from graphql.execution.collect_fields import collect_fields
+from graphql.execution.execute import CollectedErrors
+from graphql.execution.values import get_argument_values, get_directive_values
+from graphql.pyutils import Path
+from graphql_relay import cursor_to_offset, get_offset_with_default, offset_to_cursor
+
+from .archive import ArchiveChain
+from .fastpath import connection_fields, dumps
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500  # streamed rows per payload
+
+CONTENT_TYPE = 'multipart/mixed; boundary="-"; deferSpec=20220824'
+PART_HEADER = b"\r\n---\r\nContent-Type: application/json; charset=utf-8\r\n\r\n"
+CLOSE_DELIMITER = b"\r\n-----\r\n"
+
+DeferDirective = GraphQLDirective(
+    name="defer",
+    locations=[DirectiveLocation.FRAGMENT_SPREAD, DirectiveLocation.INLINE_FRAGMENT],
+    args={
+        "if": GraphQLArgument(GraphQLNonNull(GraphQLBoolean), default_value=True),
+        "label": GraphQLArgument(GraphQLString),
+    },
+    description="Send this fragment in a later payload (multipart/mixed requests).",
+)
+
+StreamDirective = GraphQLDirective(
+    name="stream",
+    locations=[DirectiveLocation.FIELD],
+    args={
+        "if": GraphQLArgument(GraphQLNonNull(GraphQLBoolean), default_value=True),
+        "label": GraphQLArgument(GraphQLString),
+        "initialCount": GraphQLArgument(GraphQLNonNull(GraphQLInt), default_value=0),
+    },
+    description="Send list items after the first initialCount in later payloads (multipart/mixed requests).",
+)
+
+DIRECTIVES = (DeferDirective, StreamDirective)
+
+
+def accepts_multipart(request):
+    return "multipart/mixed" in request.headers.get("Accept", "")
+
+
+def multipart(payloads):
+    """Encode payloads as a ``multipart/mixed`` body, one JSON part each."""
+    started = False
+    try:
+        for payload in payloads:
+            yield PART_HEADER + dumps(payload)
+            started = True
+    except Exception as e:
+        # Headers are long gone; finish the body so clients see why it ended.
+        logger.exception("Incremental delivery failed")
+        final = {"errors": [{"message": str(e)}], "hasNext": False}
+        yield PART_HEADER + dumps(final if started else {"data": None, **final})
+    yield CLOSE_DELIMITER
+
+
+# ------------------------
+# Planning
+# ------------------------
+def _with_selections(node, selections):
+    node = copy(node)
+    node.selection_set = SelectionSetNode(selections=tuple(selections))
+    return node
+
+
+def _only_field(node, name):
+    """The single field selected as ``name`` directly in ``node``, or None."""
+    matches = [s for s in node.selection_set.selections if isinstance(s, FieldNode) and s.name.value == name]
+    return matches[0] if len(matches) == 1 else None
+
+
+class Listing:
+    """
+    A root connection field split into what goes in the first payload
+    (``root``, with deferred fragments removed) and what follows.
+    """
+
+    def __init__(self, root, edges, node, stream, deferred):
+        self.key = root.alias.value if root.alias else root.name.value
+        self.edges_key = edges.alias.value if edges.alias else edges.name.value
+        self.node_key = node.alias.value if node.alias else node.name.value
+        self.stream = stream        # @stream arguments, or None
+        self.deferred = deferred    # [(label, fragment node)]
+
+        kept = [s for s in node.selection_set.selections if not any(s is f for _, f in deferred)]
+        self.node = _with_selections(node, kept)
+        self.edges = _with_selections(edges, [self.node if s is node else s for s in edges.selection_set.selections])
+        self.root = _with_selections(root, [self.edges if s is edges else s for s in root.selection_set.selections])
+
+
+def plan(ctx, root):
+    """A ``Listing`` if ``root`` streams its edges or defers node fragments, else None."""
+    if root.selection_set is None:
+        return None
+    edges = _only_field(root, "edges")
+    if edges is None or edges.selection_set is None:
+        return None
+    node = _only_field(edges, "node")
+    if node is None or node.selection_set is None:
+        return None
+
+    stream = get_directive_values(StreamDirective, edges, ctx.variable_values)
+    if stream is not None and (not stream["if"] or stream["initialCount"] < 0):
+        stream = None
+    deferred = []
+    for selection in node.selection_set.selections:
+        if isinstance(selection, (InlineFragmentNode, FragmentSpreadNode)):
+            defer = get_directive_values(DeferDirective, selection, ctx.variable_values)
+            if defer is not None and defer["if"]:
+                deferred.append((defer.get("label"), selection))
+    if stream is None and not deferred:
+        return None
+    return Listing(root, edges, node, stream, deferred)
+
+
+def _prefetches(lookups, fields):
+    """The queryset's prefetch lookups that the selected ``fields`` will read."""
+    names = {to_snake_case(nodes[0].name.value) for nodes in fields.values()}
+    return [lookup for lookup in lookups if str(getattr(lookup, "prefetch_to", lookup)).split("__")[0] in names]
+
+
+def _prefetch(rows, lookups):
+    """``prefetch_related_objects`` per model: a batch can span live and archived orders."""
+    if not lookups:
+        return
+    by_model = {}
+    for row in rows:
+        by_model.setdefault(type(row), []).append(row)
+    for instances in by_model.values():
+        prefetch_related_objects(instances, *lookups)
+
+
+# ------------------------
+# Execution
+# ------------------------
+def execute(schema, query, variables=None, operation_name=None, context=None, batch_size=None):
+    """
+    An iterator of payloads for a query that streams or defers parts of a root
+    listing, else None (run it normally). Everything before the first payload
+    is done here, so errors that graphene would report still fall back.
+    """
+    if not query or ("@defer" not in query and "@stream" not in query):
+        return None
+    try:
+        document = parse(query)
+    except GraphQLError:
+        return None
+    graphql_schema = schema.graphql_schema
+    if validate(graphql_schema, document):
+        return None
+    ctx = ExecutionContext.build(
+        graphql_schema, document, context_value=context, raw_variable_values=variables, operation_name=operation_name
+    )
+    if isinstance(ctx, list) or ctx.operation.operation != OperationType.QUERY:
+        return None
+
+    query_type = graphql_schema.query_type
+    roots = collect_fields(graphql_schema, ctx.fragments, ctx.variable_values, query_type, ctx.operation.selection_set)
+    if len(roots) != 1:
+        return None
+    (key, nodes), = roots.items()
+    field = connection_fields(schema, DjangoConnectionField).get(nodes[0].name.value)
+    if field is None or len(nodes) != 1:
+        return None
+    listing = plan(ctx, nodes[0])
+    if listing is None:
+        return None
+
+    field_def = query_type.fields[nodes[0].name.value]
+    args = get_argument_values(field_def, nodes[0], ctx.variable_values)
+    if args.get("last") is not None or args.get("before") is not None:
+        return None
+    first, max_limit = args.get("first"), field.max_limit
+    if first is not None and (first < 0 or (max_limit and first > max_limit)):
+        return None  # graphene reports the error
+    if first is None:
+        first = getattr(field, "default_limit", max_limit)
+
+    path = Path(None, key, query_type.name)
+    info = ctx.build_resolve_info(field_def, [listing.root], query_type, path)
+    try:
+        iterable = field.get_queryset_resolver()(field.connection_type, field.get_manager(), info, args)
+    except (ValidationError, GraphQLError):
+        return None
+
+    # Same window as DjangoConnectionField.resolve_connection for first/after/offset.
+    after, offset = args.get("after"), args.get("offset")
+    if offset:
+        if after:
+            offset += cursor_to_offset(after) + 1
+        after = offset_to_cursor(offset - 1)
+    length = iterable.count() if isinstance(iterable, QuerySet) else len(iterable)
+    start = min(get_offset_with_default(after, -1) + 1, length)
+    end = length if first is None else min(start + first, length)
+
+    page = iterable[start:end]
+    lookups = ()
+    if isinstance(page, (QuerySet, ArchiveChain)):
+        # Prefetched per batch below, and only for the fields each payload selects.
+        lookups = page._prefetch_related_lookups if isinstance(page, QuerySet) else page.prefetch_lookups
+        page = page.prefetch_related(None)
+    return Delivery(ctx, listing, field, iterable, page, lookups, start, end, length,
+                    has_next_page=first is not None and end < length, path=path,
+                    batch_size=batch_size or getattr(settings, "CRM_GRAPHQL_STREAM_BATCH", DEFAULT_BATCH_SIZE))
+
+
+class Delivery:
+    """Iterates the payloads of one incremental response."""
+
+    def __init__(self, ctx, listing, field, iterable, page, lookups, start, end, length, has_next_page, path, batch_size):
+        self.listing = listing
+        self.ctx = ctx
+        self.path = path
+        self.start = start
+        self.total = end - start
+        self.batch_size = batch_size
+        self.connection_class = field.connection_type
+
+        graphql_schema = ctx.schema
+        connection_type = get_named_type(graphql_schema.query_type.fields[listing.root.name.value].type)
+        self.edge_type = get_named_type(connection_type.fields["edges"].type)
+        self.node_type = get_named_type(self.edge_type.fields["node"].type)
+        self.edge_fields = ctx.collect_subfields(self.edge_type, [listing.edges])
+        node_fields = ctx.collect_subfields(self.node_type, [listing.node])
+        self.deferred = [
+            (label, collect_fields(graphql_schema, ctx.fragments, ctx.variable_values, self.node_type,
+                                   SelectionSetNode(selections=(fragment,))))
+            for label, fragment in listing.deferred
+        ]
+        self.node_prefetches = _prefetches(lookups, node_fields)
+        self.deferred_prefetches = _prefetches(lookups, {k: v for _, f in self.deferred for k, v in f.items()})
+
+        self.rows = iter(page.iterator(chunk_size=batch_size) if isinstance(page, (QuerySet, ArchiveChain)) else page)
+        self.initial = list(self.rows if listing.stream is None else islice(self.rows, listing.stream["initialCount"]))
+
+        self.connection = self.connection_class(
+            edges=self.edges(self.initial, 0),
+            page_info=PageInfo(
+                start_cursor=offset_to_cursor(start) if self.total else None,
+                end_cursor=offset_to_cursor(end - 1) if self.total else None,
+                has_previous_page=False,
+                has_next_page=has_next_page,
+            ),
+        )
+        self.connection.iterable = iterable
+        self.connection.length = length
+
+    def edges(self, rows, index):
+        _prefetch(rows, self.node_prefetches)
+        Edge = self.connection_class.Edge
+        return [Edge(node=row, cursor=offset_to_cursor(self.start + index + i)) for i, row in enumerate(rows)]
+
+    def errors(self):
+        errors = self.ctx.collected_errors.errors
+        self.ctx.collected_errors = CollectedErrors()
+        return [error.formatted for error in errors]
+
+    def __iter__(self):
+        ctx, listing = self.ctx, self.listing
+        query_type = ctx.schema.query_type
+        field_def = query_type.fields[listing.root.name.value]
+        info = ctx.build_resolve_info(field_def, [listing.root], query_type, self.path)
+        data = ctx.complete_value(field_def.type, [listing.root], info, self.path, self.connection)
+        sent = len(self.initial)
+        payload = {"data": {listing.key: data}, "hasNext": bool(self.deferred and sent) or sent < self.total}
+        errors = self.errors()
+        if errors:
+            payload["errors"] = errors
+        yield payload
+
+        edges_path = Path(self.path, listing.edges_key, None)
+        if self.deferred and self.initial:
+            yield self.deferred_payload(self.initial, 0, edges_path, has_next=sent < self.total)
+        while sent < self.total:
+            rows = list(islice(self.rows, self.batch_size))
+            if not rows:
+                break
+            items = [
+                ctx.execute_fields(self.edge_type, edge, Path(edges_path, sent + i, None), self.edge_fields)
+                for i, edge in enumerate(self.edges(rows, sent))
+            ]
+            entry = {"items": items, "path": edges_path.as_list() + [sent]}
+            if listing.stream.get("label"):
+                entry["label"] = listing.stream["label"]
+            errors = self.errors()
+            if errors:
+                entry["errors"] = errors
+            index, sent = sent, sent + len(rows)
+            yield {"incremental": [entry], "hasNext": bool(self.deferred) or sent < self.total}
+            if self.deferred:
+                yield self.deferred_payload(rows, index, edges_path, has_next=sent < self.total)
+
+    def deferred_payload(self, rows, index, edges_path, has_next):
+        _prefetch(rows, self.deferred_prefetches)
+        incremental = []
+        for i, row in enumerate(rows):
+            node_path = Path(Path(edges_path, index + i, None), self.listing.node_key, self.node_type.name)
+            for label, fields in self.deferred:
+                entry = {"data": self.ctx.execute_fields(self.node_type, row, node_path, fields),
+                         "path": node_path.as_list()}
+                if label:
+                    entry["label"] = label
+                errors = self.errors()
+                if errors:
+                    entry["errors"] = errors
+                incremental.append(entry)
+        return {"incremental": incremental, "hasNext": has_next}
@@ -0,0 +1,217 @@
+"""
+Structured log of scheduled job runs.
+
+Wrap a job in ``job_run(name)`` and record rows, errors and details on the
+yielded ``RunRecord``. Finished runs are buffered in memory and written to
+``JobRun`` with one ``bulk_create`` per flush, and as JSON lines to a rotating
+file when ``CRM_JOBLOG_FILE`` is set. The buffer flushes once
+``CRM_JOBLOG_BUFFER`` runs are pending, ``CRM_JOBLOG_FLUSH_INTERVAL`` seconds
+after the first pending run, and at process exit. Celery prefork children
+leave with ``os._exit``, which skips atexit, so they flush on
+``worker_process_shutdown``.
+
+    with job_run("update_low_stock") as run:
+        for batch in restock_low_stock():
+            run.rows += len(batch)
+"""
+import atexit
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from logging.handlers import RotatingFileHandler
+
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connection
+from django.db.models import Avg, Count, Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import JobRun
+
+logger = logging.getLogger(__name__)
+
+MAX_ERRORS = 100   # error messages kept per run; error_count has the full number
+MAX_ITEMS = 1000   # per-row entries kept in details["items"]
+
+
+class RunRecord:
+    """Mutable state of one run; becomes a ``JobRun`` row when it finishes."""
+
+    def __init__(self, name, started_at=None):
+        self.name = name
+        self.started_at = started_at or timezone.now()
+        self.finished_at = None
+        self.rows = 0
+        self.errors = []
+        self.error_count = 0
+        self.details = {}
+        self.failed = False
+
+    def error(self, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(str(message))
+
+    def fail(self, message):
+        self.failed = True
+        self.error(message)
+
+    def item(self, **values):
+        """Keep a per-row entry (capped at MAX_ITEMS) instead of writing a log line per row."""
+        items = self.details.setdefault("items", [])
+        if len(items) < MAX_ITEMS:
+            items.append(values)
+
+    def finish(self):
+        self.finished_at = timezone.now()
+        return self
+
+    def to_model(self):
+        return JobRun(
+            name=self.name,
+            status=JobRun.FAILED if self.failed else JobRun.SUCCEEDED,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            duration_ms=(self.finished_at - self.started_at).total_seconds() * 1000,
+            rows=self.rows,
+            error_count=self.error_count,
+            errors=self.errors,
+            details=self.details,
+        )
+
+
+class JobRunLog:
+    def __init__(self, buffer_size=None, flush_interval=None, path=None):
+        self.buffer_size = buffer_size or getattr(settings, "CRM_JOBLOG_BUFFER", 20)
+        self.flush_interval = flush_interval or getattr(settings, "CRM_JOBLOG_FLUSH_INTERVAL", 60)
+        self.path = path if path is not None else getattr(settings, "CRM_JOBLOG_FILE", None)
+        self._pending = []
+        self._timer = None
+        self._lock = threading.Lock()
+        self._handler = None
+
+    def add(self, run):
+        with self._lock:
+            self._pending.append(run.to_model())
+            due = len(self._pending) >= self.buffer_size
+            if not due and self._timer is None:
+                # Long-lived workers may not finish another run soon; flush on a timer too.
+                self._timer = threading.Timer(self.flush_interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            runs, self._pending = self._pending, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not runs:
+            return
+        try:
+            JobRun.objects.bulk_create(runs)
+        except DatabaseError:
+            logger.exception("Could not store %d job runs", len(runs))
+        if self.path:
+            self._write_lines(runs)
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            connection.close()  # this thread's connection
+
+    def _write_lines(self, runs):
+        if self._handler is None:
+            self._handler = RotatingFileHandler(
+                self.path,
+                maxBytes=getattr(settings, "CRM_JOBLOG_MAX_BYTES", 10 * 1024 * 1024),
+                backupCount=getattr(settings, "CRM_JOBLOG_BACKUPS", 5),
+            )
+        lines = "\n".join(
+            json.dumps({
+                "name": r.name, "status": r.status,
+                "started_at": r.started_at, "finished_at": r.finished_at,
+                "duration_ms": round(r.duration_ms, 3), "rows": r.rows,
+                "error_count": r.error_count, "errors": r.errors, "details": r.details,
+            }, cls=DjangoJSONEncoder)
+            for r in runs
+        )
+        # One record per flush: a single write, and rotation is checked once per batch.
+        self._handler.emit(logging.makeLogRecord({"msg": lines, "levelno": logging.INFO}))
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_log():
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                _log = JobRunLog()
+                atexit.register(_log.flush)
+    return _log
+
+
+@worker_process_shutdown.connect
+def _flush_worker_process(**kwargs):
+    if _log is not None:
+        _log.flush()
+
+
+def record(run):
+    get_log().add(run.finish())
+
+
+def flush():
+    get_log().flush()
+
+
+@contextmanager
+def job_run(name):
+    """Time the block as one run of ``name``; an exception marks it failed and is re-raised."""
+    run = RunRecord(name)
+    try:
+        yield run
+    except Exception as e:
+        run.fail(e)
+        raise
+    finally:
+        record(run)
+
+
+# ------------------------
+# Reporting
+# ------------------------
+def recent_runs(name=None, limit=20):
+    runs = JobRun.objects.all()
+    if name:
+        runs = runs.filter(name=name)
+    return runs[:limit]
+
+
+def duration_trends(name=None, days=14):
+    """Per job and day: runs, failures, average/max duration and rows over the last ``days`` days."""
+    runs = JobRun.objects.filter(started_at__gte=timezone.now() - timedelta(days=days))
+    if name:
+        runs = runs.filter(name=name)
+    return list(
+        runs.annotate(day=TruncDate("started_at"))
+        .values("name", "day")
+        .annotate(
+            runs=Count("id"),
+            failures=Count("id", filter=Q(status=JobRun.FAILED)),
+            avg_duration_ms=Avg("duration_ms"),
+            max_duration_ms=Max("duration_ms"),
+            rows=Sum("rows"),
+        )
+        .order_by("name", "day")
+    )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from crm.archive import DEFAULT_BATCH_SIZE, archive_range, cutoff
+from crm.joblog import job_run
+from crm.models import Order
+
+
+class Command(BaseCommand):
+    help = "Move orders older than CRM_ORDER_ARCHIVE_DAYS (or --days) to ArchivedOrder in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, help="Archive orders placed more than this many days ago.")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument("--dry-run", action="store_true", help="Only count the orders that would move.")
+
+    def handle(self, *args, **options):
+        before = cutoff(options["days"])
+        if options["dry_run"]:
+            count = Order.objects.filter(order_date__lt=before).count()
+            self.stdout.write(f"Would archive {count} orders placed before {before:%Y-%m-%d}.")
+            return
+
+        with job_run("archive_orders") as run:
+            for moved in archive_range(before, batch_size=options["batch_size"]):
+                run.rows += moved
+                self.stdout.write(f"  {run.rows} orders archived")
+        self.stdout.write(self.style.SUCCESS(f"Archived {run.rows} orders placed before {before:%Y-%m-%d}."))
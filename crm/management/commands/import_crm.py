@@ -0,0 +1,64 @@
+import csv
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.bulk import bulk_create_customers, bulk_create_products
+
+IMPORTERS = {
+    "customers": bulk_create_customers,
+    "products": bulk_create_products,
+}
+
+
+def read_rows(stream, fmt):
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+class Command(BaseCommand):
+    help = "Validate and bulk-insert customers or products from CSV/NDJSON (same columns as export_crm)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("resource", choices=sorted(IMPORTERS))
+        parser.add_argument("path", help="Input file, or '-' for stdin.")
+        parser.add_argument("--format", choices=("csv", "ndjson"), default="csv")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--max-errors", type=int, default=50, help="Error lines to print (all are counted).")
+
+    def handle(self, *args, **options):
+        importer = IMPORTERS[options["resource"]]
+        batch_size = options["batch_size"]
+        stream = sys.stdin if options["path"] == "-" else open(options["path"], newline="", encoding="utf-8")
+
+        created = failed = 0
+        batch, start = [], 1
+        try:
+            for row in read_rows(stream, options["format"]):
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    created, failed = self.flush(importer, batch, start, created, failed, options["max_errors"])
+                    start += len(batch)
+                    batch = []
+            if batch:
+                created, failed = self.flush(importer, batch, start, created, failed, options["max_errors"])
+        except (ValueError, csv.Error) as e:
+            raise CommandError(f"Could not parse input: {e}")
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {created} {options['resource']}, {failed} rows rejected."))
+
+    def flush(self, importer, batch, start, created, failed, max_errors):
+        rows, errors = importer(batch, start=start)
+        for error in errors:
+            if failed < max_errors:
+                self.stderr.write(str(error))
+            failed += 1
+        return created + len(rows), failed
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from crm.joblog import duration_trends, recent_runs
+
+
+class Command(BaseCommand):
+    help = "Show recent scheduled job runs, or per-day duration trends with --trends."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--name", help="Only this job, e.g. update_low_stock.")
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--trends", action="store_true", help="Aggregate runs per job and day.")
+        parser.add_argument("--days", type=int, default=14, help="Trend window in days (default 14).")
+
+    def handle(self, *args, **options):
+        if options["trends"]:
+            rows = duration_trends(name=options["name"], days=options["days"])
+            if not rows:
+                self.stdout.write("No runs in range.")
+            for row in rows:
+                self.stdout.write(
+                    f"{row['day']}  {row['name']:<28} {row['runs']:5d} runs  {row['failures']:3d} failed  "
+                    f"avg {row['avg_duration_ms']:10.1f} ms  max {row['max_duration_ms']:10.1f} ms  "
+                    f"{row['rows'] or 0:8d} rows"
+                )
+            return
+
+        runs = recent_runs(name=options["name"], limit=options["limit"])
+        if not runs:
+            self.stdout.write("No runs recorded.")
+        for run in runs:
+            line = (
+                f"{run.started_at:%Y-%m-%d %H:%M:%S}  {run.name:<28} {run.status:<9} "
+                f"{run.duration_ms:10.1f} ms  {run.rows:8d} rows"
+            )
+            if run.error_count:
+                line += f"  {run.error_count} errors: {run.errors[0]}"
+            self.stdout.write(self.style.ERROR(line) if run.status == run.FAILED else line)
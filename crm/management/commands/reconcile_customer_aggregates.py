@@ -0,0 +1,65 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+
+from crm.models import ArchivedOrder, Customer, Order
+
+AGGREGATE_FIELDS = ["order_count", "lifetime_value", "last_order_at"]
+
+
+class Command(BaseCommand):
+    help = "Recompute Customer.order_count/lifetime_value/last_order_at from Order and ArchivedOrder in ID-range chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--dry-run", action="store_true", help="Report drift without writing.")
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        dry_run = options["dry_run"]
+
+        bounds = Customer.objects.aggregate(lo=Min("id"), hi=Max("id"))
+        if bounds["lo"] is None:
+            self.stdout.write("No customers.")
+            return
+
+        scanned = repaired = 0
+        for start in range(bounds["lo"], bounds["hi"] + 1, chunk_size):
+            end = start + chunk_size
+            with transaction.atomic():
+                # Archived orders still count towards the totals.
+                actual = {}
+                for model in (Order, ArchivedOrder):
+                    for row in (
+                        model.objects.filter(customer_id__gte=start, customer_id__lt=end)
+                        .values("customer_id")
+                        .annotate(count=Count("id"), value=Sum("total_amount"), last=Max("order_date"))
+                    ):
+                        seen = actual.get(row["customer_id"])
+                        if seen:
+                            row["count"] += seen["count"]
+                            row["value"] = (row["value"] or 0) + (seen["value"] or 0)
+                            row["last"] = max(row["last"], seen["last"])
+                        actual[row["customer_id"]] = row
+                drifted = []
+                customers = Customer.objects.filter(id__gte=start, id__lt=end).only("id", *AGGREGATE_FIELDS)
+                for customer in customers:
+                    scanned += 1
+                    row = actual.get(customer.id)
+                    expected = (
+                        (row["count"], (row["value"] or Decimal("0.00")).quantize(Decimal("0.01")), row["last"])
+                        if row else (0, Decimal("0.00"), None)
+                    )
+                    current = (customer.order_count, customer.lifetime_value, customer.last_order_at)
+                    if current != expected:
+                        customer.order_count, customer.lifetime_value, customer.last_order_at = expected
+                        drifted.append(customer)
+
+                repaired += len(drifted)
+                if drifted and not dry_run:
+                    Customer.objects.bulk_update(drifted, AGGREGATE_FIELDS, batch_size=chunk_size)
+
+        verb = "would repair" if dry_run else "repaired"
+        self.stdout.write(self.style.SUCCESS(f"Scanned {scanned} customers, {verb} {repaired}."))
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_idempotency_record'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('SUCCEEDED', 'Succeeded'), ('FAILED', 'Failed')], default='SUCCEEDED', max_length=20)),
+                ('started_at', models.DateTimeField(db_index=True)),
+                ('finished_at', models.DateTimeField()),
+                ('duration_ms', models.FloatField()),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('error_count', models.PositiveIntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('details', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['name', '-started_at'], name='crm_jobrun_name_fc7e5b_idx')],
+            },
+        ),
+    ]
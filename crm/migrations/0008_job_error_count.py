@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0007_archived_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='error_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:08
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0008_job_error_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='crm_customer_email_lower_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0009_customer_email_lower_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencyrecord',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,11 +1,48 @@
+import uuid
+
 from django.db import models
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Lower
 from django.utils import timezone
 from decimal import Decimal
 
+class CustomerQuerySet(models.QuerySet):
+    def record_order(self, customer_id, amount, order_date):
+        """
+        Atomically fold one new order into the customer's denormalized totals.
+        Call inside the transaction that creates the order.
+        """
+        return self.filter(pk=customer_id).update(
+            order_count=F("order_count") + 1,
+            lifetime_value=F("lifetime_value") + amount,
+            last_order_at=Case(
+                When(Q(last_order_at__isnull=True) | Q(last_order_at__lt=order_date), then=Value(order_date)),
+                default=F("last_order_at"),
+            ),
+        )
+
 class Customer(models.Model):
     name = models.CharField(max_length=150)
     email = models.EmailField(unique=True)
     phone = models.CharField(max_length=30, blank=True, null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    # Denormalized from Order; maintained by CustomerQuerySet.record_order and
+    # repaired by `manage.py reconcile_customer_aggregates`.
+    order_count = models.PositiveIntegerField(default=0)
+    lifetime_value = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    last_order_at = models.DateTimeField(blank=True, null=True)
+
+    objects = CustomerQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["order_count"], name="crm_customer_order_count_idx"),
+            models.Index(fields=["lifetime_value"], name="crm_customer_ltv_idx"),
+            models.Index(fields=["last_order_at"], name="crm_customer_last_order_idx"),
+            # Case-insensitive email lookups in crm.validation.BatchValidator.existing.
+            models.Index(Lower("email"), name="crm_customer_email_lower_idx"),
+        ]
 
     def __str__(self):
         return f"{self.name} <{self.email}>"
@@ -14,6 +51,8 @@ class Product(models.Model):
     name = models.CharField(max_length=150)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
+    # Lets crm.catalog pick up changes made by other processes; set explicitly in QuerySet.update().
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.name} ({self.price})"
@@ -22,7 +61,122 @@ class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="orders")
     products = models.ManyToManyField(Product, related_name="orders")
     total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
-    order_date = models.DateTimeField(default=timezone.now)
+    order_date = models.DateTimeField(default=timezone.now, db_index=True)
 
     def __str__(self):
         return f"Order #{self.id} for {self.customer.name}"
+
+class ArchivedOrder(models.Model):
+    """An Order moved out of the live tables by ``crm.archive``; keeps the original ID."""
+
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="archived_orders")
+    products = models.ManyToManyField(Product, related_name="archived_orders")
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+    order_date = models.DateTimeField(db_index=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Archived order #{self.id} for {self.customer.name}"
+
+class Job(models.Model):
+    """Progress record for a long-running mutation executed by a Celery worker."""
+
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    SUCCEEDED = "SUCCEEDED"
+    FAILED = "FAILED"
+    STATUS_CHOICES = [(s, s.title()) for s in (PENDING, RUNNING, SUCCEEDED, FAILED)]
+    MAX_ERRORS = 100  # per-row errors stored in ``errors``; ``error_count`` has the total
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    result = models.JSONField(default=dict, blank=True)
+    errors = models.JSONField(default=list, blank=True)
+    error_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.kind} job {self.id} ({self.status})"
+
+    @property
+    def progress(self):
+        return self.processed / self.total if self.total else (1.0 if self.status == self.SUCCEEDED else 0.0)
+
+    def start(self):
+        self.status = self.RUNNING
+        self.save(update_fields=["status", "updated_at"])
+
+    def advance(self, processed, errors=(), **result):
+        """
+        Record one finished batch; list values in ``result`` are appended.
+        All errors are counted but only the first MAX_ERRORS are kept.
+        """
+        self.processed += processed
+        self.error_count += len(errors)
+        self.errors.extend(errors[:max(self.MAX_ERRORS - len(self.errors), 0)])
+        for key, value in result.items():
+            if isinstance(value, list):
+                self.result.setdefault(key, []).extend(value)
+            else:
+                self.result[key] = value
+        self.save(update_fields=["processed", "error_count", "errors", "result", "updated_at"])
+
+    def finish(self, error=None):
+        self.status = self.FAILED if error else self.SUCCEEDED
+        if error:
+            # The fatal error is always kept, even past MAX_ERRORS.
+            self.error_count += 1
+            self.errors.append(error)
+        self.finished_at = timezone.now()
+        self.save(update_fields=["status", "error_count", "errors", "finished_at", "updated_at"])
+
+class IdempotencyRecord(models.Model):
+    """Stored outcome of a mutation keyed by the client's idempotency key."""
+
+    IN_PROGRESS = "IN_PROGRESS"
+    COMPLETED = "COMPLETED"
+    STATUS_CHOICES = [(IN_PROGRESS, "In progress"), (COMPLETED, "Completed")]
+
+    key = models.CharField(max_length=255, unique=True)
+    operation = models.CharField(max_length=50)
+    request_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=IN_PROGRESS)
+    response = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+    # Lease on an IN_PROGRESS claim; past it, another request may take the key over.
+    locked_until = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.operation} [{self.key}] ({self.status})"
+
+
+class JobRun(models.Model):
+    """One execution of a scheduled job (cron or Celery), written in batches by ``crm.joblog``."""
+
+    SUCCEEDED = "SUCCEEDED"
+    FAILED = "FAILED"
+    STATUS_CHOICES = [(SUCCEEDED, "Succeeded"), (FAILED, "Failed")]
+
+    name = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=SUCCEEDED)
+    started_at = models.DateTimeField(db_index=True)
+    finished_at = models.DateTimeField()
+    duration_ms = models.FloatField()
+    rows = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    details = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        ordering = ["-started_at"]
+        indexes = [models.Index(fields=["name", "-started_at"])]
+
+    def __str__(self):
+        return f"{self.name} at {self.started_at:%Y-%m-%d %H:%M:%S} ({self.status})"
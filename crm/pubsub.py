@@ -0,0 +1,188 @@
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# ------------------------
+# Channels
+# ------------------------
+ORDER_CREATED = "order_created"
+PRODUCT_STOCK_CHANGED = "product_stock_changed"
+
+DEFAULT_BROKER = "crm.pubsub.InMemoryBroker"
+
+
+# ------------------------
+# Subscriber queue
+# ------------------------
+class Subscription:
+    """
+    A single listener bound to the event loop that created it.
+
+    Events published with the same ``key`` while the listener is busy are
+    coalesced so that only the latest one is delivered; keyless events are
+    always delivered in order. ``max_pending`` bounds memory for slow clients
+    by dropping the oldest pending events.
+    """
+
+    _seq = itertools.count()
+
+    def __init__(self, loop, max_pending=1000):
+        self.loop = loop
+        self.max_pending = max_pending
+        self._pending = OrderedDict()
+        self._ready = asyncio.Event()
+
+    def deliver(self, payload, key=None):
+        # May be called from any thread (sync Django views, signal handlers).
+        try:
+            self.loop.call_soon_threadsafe(self._push, payload, key)
+        except RuntimeError:
+            # Loop already closed; the listener is gone.
+            pass
+
+    def _push(self, payload, key):
+        if key is None:
+            key = ("_", next(self._seq))
+        else:
+            self._pending.pop(key, None)
+        self._pending[key] = payload
+        while len(self._pending) > self.max_pending:
+            self._pending.popitem(last=False)
+        self._ready.set()
+
+    def __aiter__(self):
+        return self._drain()
+
+    async def _drain(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            batch = list(self._pending.values())
+            self._pending.clear()
+            for payload in batch:
+                yield payload
+
+
+# ------------------------
+# Brokers
+# ------------------------
+class InMemoryBroker:
+    """Single-process broker; suitable for local development and one ASGI worker."""
+
+    def __init__(self, max_pending=1000):
+        self.max_pending = max_pending
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, payload, key=None):
+        self._fan_out(channel, payload, key)
+
+    def _fan_out(self, channel, payload, key=None):
+        with self._lock:
+            subscribers = tuple(self._subscribers.get(channel, ()))
+        for sub in subscribers:
+            sub.deliver(payload, key)
+
+    def subscribe(self, channel):
+        sub = Subscription(asyncio.get_running_loop(), max_pending=self.max_pending)
+        with self._lock:
+            self._subscribers[channel].add(sub)
+        return sub
+
+    def unsubscribe(self, channel, sub):
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is not None:
+                subscribers.discard(sub)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+
+class RedisBroker(InMemoryBroker):
+    """
+    Multi-node broker: events are published to Redis and every process relays
+    them to its local subscribers. Requires the ``redis`` package.
+    """
+
+    prefix = "crm:"
+    max_reconnect_delay = 30  # seconds
+
+    def __init__(self, url=None, max_pending=1000):
+        super().__init__(max_pending=max_pending)
+        import redis
+
+        self.url = url or getattr(settings, "CRM_PUBSUB_REDIS_URL", "redis://localhost:6379/1")
+        self._redis = redis.Redis.from_url(self.url)
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def publish(self, channel, payload, key=None):
+        message = json.dumps({"payload": payload, "key": key}, cls=DjangoJSONEncoder)
+        self._redis.publish(self.prefix + channel, message)
+
+    def subscribe(self, channel):
+        self._ensure_listener()
+        return super().subscribe(channel)
+
+    def _ensure_listener(self):
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="crm-pubsub", daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        # Runs for the life of the process: a lost connection is logged and
+        # re-established with backoff. Events published meanwhile are missed,
+        # as with any Redis pub/sub subscriber.
+        delay = 1
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self.prefix + "*")
+                delay = 1
+                for message in pubsub.listen():
+                    channel = message["channel"].decode()[len(self.prefix):]
+                    data = json.loads(message["data"])
+                    self._fan_out(channel, data["payload"], data["key"])
+            except Exception:
+                logger.exception("Pub/sub relay from %s failed; reconnecting in %ss", self.url, delay)
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker_class = import_string(getattr(settings, "CRM_PUBSUB_BROKER", DEFAULT_BROKER))
+                _broker = broker_class()
+    return _broker
+
+
+def publish(channel, payload, key=None):
+    get_broker().publish(channel, payload, key=key)
+
+
+async def listen(channel):
+    broker = get_broker()
+    sub = broker.subscribe(channel)
+    try:
+        async for payload in sub:
+            yield payload
+    finally:
+        broker.unsubscribe(channel, sub)
@@ -0,0 +1,339 @@
+"""
+Token-bucket rate limiting and per-client concurrency caps for the GraphQL
+endpoint.
+
+Each client (a key from ``CRM_API_KEYS`` sent as ``X-API-Key``, else the
+signed-in user, else the remote address) has one bucket for queries and one
+for mutations. A request consumes tokens in proportion to
+its estimated cost, so ``bulkCreateCustomers`` with 500 rows or a wide nested
+listing costs more than ``{ hello }``. Configure with ``CRM_RATE_LIMITS``;
+state lives in ``CRM_RATELIMIT_STORE`` (in-process by default).
+"""
+import json
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from django.utils.module_loading import import_string
+from graphene_django.views import GraphQLView
+from graphql import GraphQLError, parse
+from graphql.language import FieldNode, ListValueNode, OperationDefinitionNode, VariableNode
+
+DEFAULT_LIMITS = {
+    "query": {"rate": 20.0, "burst": 100},     # tokens per second, bucket size
+    "mutation": {"rate": 2.0, "burst": 20},
+    "concurrency": 4,                          # in-flight requests per client
+    "cost_unit": 50,                           # estimated cost units per token
+    "default_page_size": 50,                   # assumed list size when `first` is absent
+}
+DEFAULT_STORE = "crm.ratelimit.LocalStore"
+
+
+def limits():
+    return {**DEFAULT_LIMITS, **getattr(settings, "CRM_RATE_LIMITS", {})}
+
+
+# ------------------------
+# Stores
+# ------------------------
+class LocalStore:
+    """
+    Per-process state. Limits are per worker process, not global.
+
+    Buckets that have refilled completely are indistinguishable from new ones,
+    so they are dropped on a periodic sweep; in-flight counts are dropped when
+    they reach zero. Memory tracks recently active clients only.
+    """
+
+    sweep_interval = 60  # seconds
+
+    def __init__(self):
+        self._buckets = {}  # key -> (tokens, last, full_at)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + self.sweep_interval
+
+    def consume(self, key, cost, rate, burst):
+        """Take ``cost`` tokens; return ``(allowed, remaining, retry_after_seconds)``."""
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._buckets = {k: b for k, b in self._buckets.items() if b[2] > now}
+                self._next_sweep = now + self.sweep_interval
+            tokens, last, _ = self._buckets.get(key, (burst, now, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            return allowed, tokens, 0.0 if allowed else (cost - tokens) / rate
+
+    def acquire(self, key, limit):
+        with self._lock:
+            current = self._inflight.get(key, 0)
+            if current >= limit:
+                return False
+            self._inflight[key] = current + 1
+            return True
+
+    def release(self, key):
+        with self._lock:
+            current = self._inflight.get(key, 1) - 1
+            if current <= 0:
+                self._inflight.pop(key, None)
+            else:
+                self._inflight[key] = current
+
+
+class CacheStore:
+    """
+    Shared state in a Django cache (e.g. Redis/Memcached) so limits hold across
+    workers. Bucket updates are last-writer-wins, which can over-admit a little
+    under heavy contention; in-flight counts use atomic incr/decr.
+    """
+
+    prefix = "crm-rl:"
+    inflight_ttl = 300  # seconds; guards against leaked slots after a crash
+
+    def __init__(self, alias=None):
+        self.cache = caches[alias or getattr(settings, "CRM_RATELIMIT_CACHE", "default")]
+
+    def consume(self, key, cost, rate, burst):
+        now = time.time()
+        cache_key = self.prefix + "b:" + key
+        tokens, last = self.cache.get(cache_key) or (burst, now)
+        tokens = min(burst, tokens + max(0.0, now - last) * rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self.cache.set(cache_key, (tokens, now), timeout=int(burst / rate) + 60)
+        return allowed, tokens, 0.0 if allowed else (cost - tokens) / rate
+
+    def acquire(self, key, limit):
+        cache_key = self.prefix + "c:" + key
+        self.cache.add(cache_key, 0, timeout=self.inflight_ttl)
+        if self.cache.incr(cache_key) > limit:
+            self.cache.decr(cache_key)
+            return False
+        return True
+
+    def release(self, key):
+        try:
+            self.cache.decr(self.prefix + "c:" + key)
+        except ValueError:
+            pass
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = import_string(getattr(settings, "CRM_RATELIMIT_STORE", DEFAULT_STORE))()
+    return _store
+
+
+# ------------------------
+# Cost estimation
+# ------------------------
+def _int_argument(node, names, variables):
+    for arg in node.arguments or ():
+        if arg.name.value in names:
+            value = arg.value
+            if isinstance(value, VariableNode):
+                raw = variables.get(value.name.value)
+            else:
+                raw = getattr(value, "value", None)
+            try:
+                return int(raw)
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def _list_argument_size(node, variables):
+    size = 0
+    for arg in node.arguments or ():
+        value = arg.value
+        if isinstance(value, ListValueNode):
+            size += len(value.values)
+        elif isinstance(value, VariableNode) and isinstance(variables.get(value.name.value), list):
+            size += len(variables[value.name.value])
+    return size
+
+
+def _selection_cost(selection_set, variables, page_size, depth=0):
+    cost = 0
+    for node in selection_set.selections if selection_set else ():
+        if not isinstance(node, FieldNode):
+            # Fragments: count their fields at the same level.
+            cost += _selection_cost(getattr(node, "selection_set", None), variables, page_size, depth)
+            continue
+        cost += 1 + _list_argument_size(node, variables)
+        if node.selection_set:
+            multiplier = _int_argument(node, ("first", "last"), variables)
+            if multiplier is None:
+                multiplier = page_size if depth == 0 else 1
+            cost += max(1, multiplier) * _selection_cost(node.selection_set, variables, page_size, depth + 1)
+    return cost
+
+
+def estimate(query, variables=None, operation_name=None):
+    """Return ``(operation_type, cost_units)``; ``("query", 1)`` if unparsable."""
+    try:
+        document = parse(query)
+    except GraphQLError:
+        return "query", 1
+    operations = [d for d in document.definitions if isinstance(d, OperationDefinitionNode)]
+    if operation_name:
+        operations = [d for d in operations if d.name and d.name.value == operation_name] or operations
+    if not operations:
+        return "query", 1
+    operation = operations[0]
+    kind = "mutation" if operation.operation.value == "mutation" else "query"
+    # Root query fields without `first` are assumed to return a page; mutation payloads aren't lists.
+    page_size = limits()["default_page_size"] if kind == "query" else 1
+    return kind, _selection_cost(operation.selection_set, variables or {}, page_size)
+
+
+# ------------------------
+# Middleware
+# ------------------------
+def client_key(request):
+    # Only configured keys get their own bucket; anything else would let a
+    # client mint a fresh bucket per request by inventing keys.
+    api_key = request.headers.get("X-Api-Key")
+    if api_key and api_key in getattr(settings, "CRM_API_KEYS", ()):
+        return "key:" + api_key
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return "ip:" + request.META.get("REMOTE_ADDR", "unknown")
+
+
+def _variables(raw):
+    # GraphQLView accepts variables as an object or as a JSON-encoded string.
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            return {}
+    return raw if isinstance(raw, dict) else {}
+
+
+def _body(request):
+    # Mirrors GraphQLView.parse_body, minus its 400s: the view rejects those itself.
+    content_type = GraphQLView.get_content_type(request)
+    if content_type == "application/graphql":
+        return {"query": request.body.decode(errors="replace")}
+    if content_type == "application/json":
+        try:
+            body = json.loads(request.body or b"{}")
+        except ValueError:
+            return {}
+        if isinstance(body, list):  # batched
+            body = body[0] if body else {}
+        return body if isinstance(body, dict) else {}
+    if content_type in ("application/x-www-form-urlencoded", "multipart/form-data"):
+        return request.POST
+    return {}
+
+
+def graphql_params(request):
+    """
+    ``(query, variables, operation_name)`` as GraphQLView.get_graphql_params
+    would see them (URL parameters win over the body); malformed parts come
+    back empty.
+    """
+    body = _body(request)
+    query = request.GET.get("query") or body.get("query")
+    variables = request.GET.get("variables") or body.get("variables")
+    operation_name = request.GET.get("operationName") or body.get("operationName")
+    return (
+        query if isinstance(query, str) else "",
+        _variables(variables),
+        operation_name if isinstance(operation_name, str) else None,
+    )
+
+
+def too_many_requests(message, retry_after, limit=None):
+    retry_after = max(1, math.ceil(retry_after))
+    response = JsonResponse(
+        {"errors": [{"message": message, "extensions": {"code": "RATE_LIMITED", "retryAfter": retry_after}}]},
+        status=429,
+    )
+    response["Retry-After"] = str(retry_after)
+    if limit is not None:
+        response["X-RateLimit-Limit"] = str(limit)
+        response["X-RateLimit-Remaining"] = "0"
+    return response
+
+
+class ReleaseOnClose:
+    """Streaming content wrapper that calls ``release`` once when the response is closed."""
+
+    def __init__(self, content, release):
+        self.content = content
+        self.release = release
+
+    def __iter__(self):
+        return iter(self.content)
+
+    def __aiter__(self):
+        # StreamingHttpResponse falls back to this when ``content`` is async (ASGI).
+        return aiter(self.content)
+
+    def close(self):
+        release, self.release = self.release, None
+        if release is not None:
+            release()
+
+
+class GraphQLRateLimitMiddleware:
+    paths = ("/graphql", "/graphql/")
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path not in self.paths or request.method not in ("GET", "POST"):
+            return self.get_response(request)
+
+        config = limits()
+        store = get_store()
+        client = client_key(request)
+
+        query, variables, operation_name = graphql_params(request)
+        kind, units = estimate(query, variables, operation_name) if query else ("query", 1)
+        bucket = config[kind]
+        tokens = min(bucket["burst"], max(1, math.ceil(units / config["cost_unit"])))
+
+        if not store.acquire(client, config["concurrency"]):
+            return too_many_requests("Too many concurrent requests", 1)
+        streaming = False
+        try:
+            allowed, remaining, retry_after = store.consume(
+                f"{client}:{kind}", tokens, bucket["rate"], bucket["burst"]
+            )
+            if not allowed:
+                return too_many_requests(f"Rate limit exceeded for {kind} requests", retry_after, bucket["burst"])
+            response = self.get_response(request)
+            streaming = response.streaming
+            if streaming:
+                # @stream/@defer responses hold their slot until the last payload is sent.
+                response.streaming_content = ReleaseOnClose(response.streaming_content, lambda: store.release(client))
+        finally:
+            if not streaming:
+                store.release(client)
+
+        response["X-RateLimit-Limit"] = str(bucket["burst"])
+        response["X-RateLimit-Remaining"] = str(int(remaining))
+        response["X-RateLimit-Cost"] = str(tokens)
+        return response
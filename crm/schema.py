@@ -1,36 +1,152 @@
-import re
 from decimal import Decimal
 
 import graphene
 from graphene import Field, List
+from graphene.types.generic import GenericScalar
 from graphene_django import DjangoObjectType
 from graphene_django.filter import DjangoFilterConnectionField
-from django.db import transaction, IntegrityError
-from django.utils import timezone
-from datetime import datetime
-from django.db import transaction
+from graphene_django.settings import graphene_settings
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from .models import Customer, Product, Order
-from .filters import CustomerFilter, ProductFilter, OrderFilter
-from crm.models import Product"
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Customer, Product, Order, ArchivedOrder, Job, JobRun
+from .filters import CustomerFilter, ProductFilter, OrderFilter, ArchivedOrderFilter, JobRunFilter
+from .archive import ArchiveChain
+from .bulk import bulk_create_customers, restock_low_stock
+from .catalog import get_catalog, product_prices
+from .idempotency import IdempotencyError, run_idempotent
+from .joblog import duration_trends
+from .validation import RowError, customer_validator, product_validator
+from .pubsub import ORDER_CREATED, PRODUCT_STOCK_CHANGED, listen
 
 # ------------------------
 # GraphQL Types
 # ------------------------
+class CountableConnection(graphene.relay.Connection):
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int()
+
+    def resolve_total_count(root, info):
+        return root.length
+
+class OrderConnection(CountableConnection):
+    class Meta:
+        abstract = True
+
+    total_revenue = graphene.Decimal()
+
+    def resolve_total_revenue(root, info):
+        total = root.iterable.aggregate(total=Sum("total_amount"))["total"] or Decimal("0.00")
+        return total.quantize(Decimal("0.01"))
+
 class CustomerType(DjangoObjectType):
     class Meta:
         model = Customer
-        fields = ("id", "name", "email", "phone")
+        fields = ("id", "name", "email", "phone", "created_at", "order_count", "lifetime_value", "last_order_at")
+        use_connection = True
+        connection_class = CountableConnection
 
 class ProductType(DjangoObjectType):
     class Meta:
         model = Product
         fields = ("id", "name", "price", "stock")
+        use_connection = True
+        connection_class = CountableConnection
 
 class OrderType(DjangoObjectType):
+    # Plain list rather than the connection graphene-django derives once ProductType has one.
+    products = List(ProductType)
+
     class Meta:
         model = Order
         fields = ("id", "customer", "products", "total_amount", "order_date")
+        use_connection = True
+        connection_class = OrderConnection
+
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        return queryset.select_related("customer").prefetch_related("products")
+
+    @classmethod
+    def is_type_of(cls, root, info):
+        # orders(includeArchived: true) also yields ArchivedOrder rows, which have the same fields.
+        return isinstance(root, ArchivedOrder) or super().is_type_of(root, info)
+
+    def resolve_products(root, info):
+        return root.products.all()
+
+class ListingConnectionField(DjangoFilterConnectionField):
+    """
+    Root listing that accepts ``first`` up to ``CRM_GRAPHQL_MAX_ROWS`` (large
+    fast-path and @stream reads), while a request without ``first``/``last``
+    still gets graphene's default page rather than the whole table.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("max_limit", getattr(settings, "CRM_GRAPHQL_MAX_ROWS", 100_000))
+        super().__init__(*args, **kwargs)
+        self.default_limit = min(self.max_limit, graphene_settings.RELAY_CONNECTION_MAX_LIMIT)
+
+    def wrap_resolve(self, parent_resolver):
+        resolve = super().wrap_resolve(parent_resolver)
+
+        def resolve_page(root, info, **args):
+            if args.get("first") is None and args.get("last") is None:
+                args["first"] = self.default_limit
+            return resolve(root, info, **args)
+
+        return resolve_page
+
+class OrderConnectionField(ListingConnectionField):
+    """``orders``: live orders, followed by matching archived ones when ``includeArchived`` is true."""
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, filtering_args, filterset_class):
+        live = super().resolve_queryset(connection, iterable, info, args, filtering_args, filterset_class)
+        if not args.get("include_archived"):
+            return live
+        data = {k: v for k, v in args.items() if k in filtering_args}
+        archived = ArchivedOrderFilter(
+            data=data, queryset=OrderType.get_queryset(ArchivedOrder.objects.all(), info), request=info.context
+        )
+        if not archived.is_valid():
+            raise ValidationError(archived.form.errors.as_json())
+        return ArchiveChain(live, archived.qs)
+
+class JobType(DjangoObjectType):
+    result = GenericScalar()
+    errors = List(graphene.String)
+    progress = graphene.Float()
+
+    class Meta:
+        model = Job
+        fields = ("id", "kind", "status", "total", "processed", "result", "errors", "error_count",
+                  "created_at", "updated_at", "finished_at")
+
+class JobRunType(DjangoObjectType):
+    errors = List(graphene.String)
+    details = GenericScalar()
+
+    class Meta:
+        model = JobRun
+        fields = ("id", "name", "status", "started_at", "finished_at", "duration_ms", "rows",
+                  "error_count", "errors", "details")
+        use_connection = True
+        connection_class = CountableConnection
+
+class JobRunTrendType(graphene.ObjectType):
+    name = graphene.String()
+    day = graphene.Date()
+    runs = graphene.Int()
+    failures = graphene.Int()
+    avg_duration_ms = graphene.Float()
+    max_duration_ms = graphene.Float()
+    rows = graphene.Int()
 
 
 # ------------------------
@@ -52,20 +168,11 @@ class CreateOrderInput(graphene.InputObjectType):
     order_date = graphene.DateTime(required=False)
 
 
-# ------------------------
-# Validators / Utilities
-# ------------------------
-PHONE_RE = re.compile(r"^(\+\d{7,15}|\d{3}-\d{3}-\d{4})$")
-
-def validate_phone(phone: str) -> bool:
-    if phone in (None, "",):
-        return True
-    return bool(PHONE_RE.match(phone))
+class RowErrorType(graphene.ObjectType):
+    row = graphene.Int()
+    field = graphene.String()
+    message = graphene.String()
 
-def decimal_from(value):
-    # Accept str/float/Decimal and normalize to Decimal with 2dp
-    d = Decimal(str(value))
-    return d.quantize(Decimal("0.01"))
 
 # ------------------------
 # Mutations
@@ -73,75 +180,90 @@ def decimal_from(value):
 class CreateCustomer(graphene.Mutation):
     class Arguments:
         input = CreateCustomerInput(required=True)
+        idempotency_key = graphene.String()
 
     customer = Field(CustomerType)
     message = graphene.String()
     errors = List(graphene.String)
+    replayed = graphene.Boolean()
 
     @staticmethod
-    def mutate(root, info, input):
-        errors = []
-
-        # Email uniqueness
-        if Customer.objects.filter(email__iexact=input.email).exists():
-            errors.append("Email already exists")
-
-        # Phone format
-        if not validate_phone(getattr(input, "phone", None)):
-            errors.append("Invalid phone format. Use +1234567890 or 123-456-7890")
-
-        if errors:
-            return CreateCustomer(customer=None, message=None, errors=errors)
+    def mutate(root, info, input, idempotency_key=None):
+        def execute():
+            result = customer_validator.validate([input])
+            if result.errors:
+                return None, {"customer_id": None, "errors": [e.message for e in result.errors]}
+            cust = Customer.objects.create(**result.cleaned[0])
+            return cust, {"customer_id": cust.pk, "errors": []}
 
-        cust = Customer.objects.create(
-            name=input.name.strip(),
-            email=input.email.strip(),
-            phone=(input.phone or "").strip() or None,
-        )
-        return CreateCustomer(customer=cust, message="Customer created successfully", errors=[])
+        try:
+            cust, stored, replayed = run_idempotent(idempotency_key, "createCustomer", input, execute)
+        except IdempotencyError as e:
+            return CreateCustomer(customer=None, message=None, errors=[str(e)], replayed=False)
+        if replayed and stored["customer_id"]:
+            cust = Customer.objects.filter(pk=stored["customer_id"]).first()
+        if stored["errors"]:
+            return CreateCustomer(customer=None, message=None, errors=stored["errors"], replayed=replayed)
+        return CreateCustomer(customer=cust, message="Customer created successfully", errors=[], replayed=replayed)
 
 
 class BulkCreateCustomers(graphene.Mutation):
     class Arguments:
         input = List(CreateCustomerInput, required=True)
+        run_async = graphene.Boolean(default_value=False)
+        idempotency_key = graphene.String()
 
     customers = List(CustomerType)
     errors = List(graphene.String)
+    row_errors = List(RowErrorType)
+    job = Field(JobType)
+    replayed = graphene.Boolean()
 
     @staticmethod
-    def mutate(root, info, input):
-        created = []
-        errors = []
-
-        # Use a top-level transaction with per-item savepoints to allow partial success.
-        with transaction.atomic():
-            for idx, item in enumerate(input, start=1):
-                item_errs = []
+    def mutate(root, info, input, run_async=False, idempotency_key=None):
+        rows = [{"name": item.name, "email": item.email, "phone": item.phone} for item in input]
+        if run_async:
+            # Reject obviously bad batches before a Job is created and queued.
+            rejected = customer_validator.precheck(rows, max_rows=getattr(settings, "CRM_BULK_MAX_ROWS", 100_000))
+            if rejected:
+                return BulkCreateCustomers(
+                    customers=[], errors=[str(e) for e in rejected], row_errors=rejected, replayed=False,
+                )
+
+        def execute():
+            if run_async:
+                # Imported lazily so schema import doesn't pull in the Celery task module.
+                from .tasks import bulk_create_customers_job
+
+                job = Job.objects.create(kind="bulk_create_customers", total=len(rows))
+                transaction.on_commit(lambda: bulk_create_customers_job.delay(str(job.pk), rows))
+                return ([], [], job), {"customer_ids": [], "row_errors": [], "job_id": job.pk}
+
+            created, row_errors = bulk_create_customers(rows)
+            stored = {
+                "customer_ids": [c.pk for c in created],
+                "row_errors": [{"row": e.row, "field": e.field, "message": e.message, "value": e.value}
+                               for e in row_errors],
+                "job_id": None,
+            }
+            return (created, row_errors, None), stored
 
-                if Customer.objects.filter(email__iexact=item.email).exists():
-                    item_errs.append(f"[{idx}] Email already exists: {item.email}")
-
-                if not validate_phone(getattr(item, "phone", None)):
-                    item_errs.append(f"[{idx}] Invalid phone format: {item.phone}")
-
-                if item_errs:
-                    errors.extend(item_errs)
-                    continue
-
-                sid = transaction.savepoint()
-                try:
-                    cust = Customer.objects.create(
-                        name=item.name.strip(),
-                        email=item.email.strip(),
-                        phone=(item.phone or "").strip() or None,
-                    )
-                    created.append(cust)
-                    transaction.savepoint_commit(sid)
-                except IntegrityError as e:
-                    transaction.savepoint_rollback(sid)
-                    errors.append(f"[{idx}] Failed to create customer: {str(e)}")
-
-        return BulkCreateCustomers(customers=created, errors=errors)
+        try:
+            value, stored, replayed = run_idempotent(
+                idempotency_key, "bulkCreateCustomers", {"rows": rows, "run_async": run_async}, execute
+            )
+        except IdempotencyError as e:
+            return BulkCreateCustomers(customers=[], errors=[str(e)], row_errors=[], replayed=False)
+
+        if replayed:
+            created = list(Customer.objects.filter(pk__in=stored["customer_ids"]).order_by("pk"))
+            row_errors = [RowError(**e) for e in stored["row_errors"]]
+            job = Job.objects.filter(pk=stored["job_id"]).first() if stored["job_id"] else None
+        else:
+            created, row_errors, job = value
+        return BulkCreateCustomers(
+            customers=created, errors=[str(e) for e in row_errors], row_errors=row_errors, job=job, replayed=replayed,
+        )
 
 
 class CreateProduct(graphene.Mutation):
@@ -153,41 +275,39 @@ class CreateProduct(graphene.Mutation):
 
     @staticmethod
     def mutate(root, info, input):
-        errs = []
-
-        try:
-            price = decimal_from(input.price)
-            if price <= Decimal("0"):
-                errs.append("Price must be positive")
-        except Exception:
-            errs.append("Invalid price format")
-
-        stock = getattr(input, "stock", 0)
-        if stock is None:
-            stock = 0
-        if stock < 0:
-            errs.append("Stock cannot be negative")
-
-        if errs:
-            return CreateProduct(product=None, errors=errs)
+        result = product_validator.validate([input])
+        if result.errors:
+            return CreateProduct(product=None, errors=[e.message for e in result.errors])
 
-        p = Product.objects.create(
-            name=input.name.strip(),
-            price=price,
-            stock=stock,
-        )
+        p = Product.objects.create(**result.cleaned[0])
         return CreateProduct(product=p, errors=[])
 
 
 class CreateOrder(graphene.Mutation):
     class Arguments:
         input = CreateOrderInput(required=True)
+        idempotency_key = graphene.String()
 
     order = Field(OrderType)
     errors = List(graphene.String)
+    replayed = graphene.Boolean()
 
     @staticmethod
-    def mutate(root, info, input):
+    def mutate(root, info, input, idempotency_key=None):
+        def execute():
+            order, errs = CreateOrder.place_order(input)
+            return order, {"order_id": order.pk if order else None, "errors": errs}
+
+        try:
+            order, stored, replayed = run_idempotent(idempotency_key, "createOrder", input, execute)
+        except IdempotencyError as e:
+            return CreateOrder(order=None, errors=[str(e)], replayed=False)
+        if replayed and stored["order_id"]:
+            order = Order.objects.filter(pk=stored["order_id"]).first()
+        return CreateOrder(order=order, errors=stored["errors"], replayed=replayed)
+
+    @staticmethod
+    def place_order(input):
         errs = []
 
         # Validate customer
@@ -197,36 +317,68 @@ class CreateOrder(graphene.Mutation):
             errs.append("Invalid customer ID")
             customer = None
 
-        # Validate products
+        # Validate products against the in-process catalog snapshot
         product_ids = list(input.product_ids or [])
         if not product_ids:
             errs.append("At least one product must be selected")
-        products = []
-        if product_ids:
-            existing = list(Product.objects.filter(id__in=product_ids))
-            found_ids = {str(p.id) for p in existing}
-            missing = [pid for pid in map(str, product_ids) if pid not in found_ids]
-            if missing:
-                errs.append(f"Invalid product ID(s): {', '.join(missing)}")
-            products = existing
+        requested = {}
+        for pid in map(str, product_ids):
+            requested[pid] = int(pid) if pid.isdigit() else None
+        prices = product_prices([pid for pid in requested.values() if pid is not None])
+        missing = [raw for raw, pid in requested.items() if pid not in prices]
+        if missing:
+            errs.append(f"Invalid product ID(s): {', '.join(missing)}")
 
         if errs:
-            return CreateOrder(order=None, errors=errs)
+            return None, errs
+
+        ids = list(dict.fromkeys(requested.values()))
+        try:
+            with transaction.atomic():
+                order_date = getattr(input, "order_date", None) or timezone.now()
+                # Total from catalog prices; same values the database holds as of the last refresh.
+                total = sum((prices[pid][0] for pid in ids), Decimal("0.00")).quantize(Decimal("0.01"))
+                order = Order.objects.create(customer=customer, order_date=order_date, total_amount=total)
+
+                # Associate products
+                order.products.add(*ids)
 
-        with transaction.atomic():
-            order_date = getattr(input, "order_date", None) or timezone.now()
-            order = Order.objects.create(customer=customer, order_date=order_date)
+                Customer.objects.record_order(customer.pk, order.total_amount, order.order_date)
+                customer.refresh_from_db(fields=["order_count", "lifetime_value", "last_order_at"])
+        except IntegrityError:
+            # A product in the snapshot was deleted by another process since the last refresh.
+            get_catalog().refresh()
+            return None, ["Invalid product ID(s): one or more products no longer exist"]
+
+        return order, []
+
+
+class UpdateLowStockProducts(graphene.Mutation):
+    class Arguments:
+        run_async = graphene.Boolean(default_value=False)
 
-            # Associate products
-            order.products.add(*products)
+    success = graphene.Boolean()
+    message = graphene.String()
+    products = List(ProductType)
+    job = Field(JobType)
 
-            # Compute accurate total_amount from DB values
-            total = sum((p.price for p in products), Decimal("0.00"))
-            order.total_amount = total.quantize(Decimal("0.01"))
-            order.save(update_fields=["total_amount"])
+    @staticmethod
+    def mutate(root, info, run_async=False):
+        if run_async:
+            from .tasks import restock_low_stock_job
 
-        return CreateOrder(order=order, errors=[])
+            job = Job.objects.create(kind="restock_low_stock")
+            transaction.on_commit(lambda: restock_low_stock_job.delay(str(job.pk)))
+            return UpdateLowStockProducts(success=True, message="Restock job queued.", products=[], job=job)
 
+        updated_ids = [pid for batch in restock_low_stock() for pid, _, _ in batch]
+        updated_products = Product.objects.filter(id__in=updated_ids).order_by("id")
+
+        return UpdateLowStockProducts(
+            success=True,
+            message="Low stock products restocked successfully.",
+            products=updated_products,
+        )
 
 # ------------------------
 # Public Mutation & Query
@@ -236,158 +388,57 @@ class Mutation(graphene.ObjectType):
     bulk_create_customers = BulkCreateCustomers.Field()
     create_product = CreateProduct.Field()
     create_order = CreateOrder.Field()
+    update_low_stock_products = UpdateLowStockProducts.Field()
 
 # Keep your earlier hello field so queries still pass checkpoints
 class Query(graphene.ObjectType):
     hello = graphene.String(default_value="Hello, GraphQL!")
-class CustomerType(DjangoObjectType):
-    class Meta:
-        model = Customer
-class CustomerType(DjangoObjectType):
-    class Meta:
-        model = Customer
+    job = graphene.Field(JobType, id=graphene.UUID(required=True))
+    customers = ListingConnectionField(CustomerType, filterset_class=CustomerFilter)
+    products = ListingConnectionField(ProductType, filterset_class=ProductFilter)
+    orders = OrderConnectionField(OrderType, filterset_class=OrderFilter)
+    job_runs = DjangoFilterConnectionField(JobRunType, filterset_class=JobRunFilter)
+    job_run_trends = List(JobRunTrendType, name=graphene.String(), days=graphene.Int(default_value=14))
 
-class ProductType(DjangoObjectType):
-    class Meta:
-        model = Product
+    def resolve_job(root, info, id):
+        return Job.objects.filter(pk=id).first()
 
-class OrderType(DjangoObjectType):
-    class Meta:
-        model = Order
-class CustomerInput(graphene.InputObjectType):
-    name = graphene.String(required=True)
-    email = graphene.String(required=True)
-    phone = graphene.String()
+    def resolve_job_run_trends(root, info, name=None, days=14):
+        return duration_trends(name=name, days=days)
 
-class ProductInput(graphene.InputObjectType):
-    name = graphene.String(required=True)
-    price = graphene.Float(required=True)
-    stock = graphene.Int(default_value=0)
 
-class OrderInput(graphene.InputObjectType):
-    customer_id = graphene.ID(required=True)
-    product_ids = graphene.List(graphene.ID, required=True)
+# ------------------------
+# Subscriptions
+# ------------------------
+class OrderCreatedEvent(graphene.ObjectType):
+    id = graphene.ID()
+    customer_id = graphene.ID()
+    total_amount = graphene.Decimal()
     order_date = graphene.DateTime()
-class CreateCustomer(graphene.Mutation):
-    class Arguments:
-        input = CustomerInput(required=True)
-
-    customer = graphene.Field(CustomerType)
-    message = graphene.String()
 
-    def mutate(self, info, input):
-        if Customer.objects.filter(email=input.email).exists():
-            raise Exception("Email already exists")
+    def resolve_order_date(root, info):
+        # Events relayed through an external broker arrive JSON-encoded.
+        value = root["order_date"]
+        return parse_datetime(value) if isinstance(value, str) else value
 
-        if input.phone and not re.match(r'^(\+\d{10,15}|\d{3}-\d{3}-\d{4})$', input.phone):
-            raise Exception("Invalid phone format")
 
-        customer = Customer.objects.create(
-            name=input.name,
-            email=input.email,
-            phone=input.phone
-        )
-        return CreateCustomer(customer=customer, message="Customer created successfully")
-class BulkCreateCustomers(graphene.Mutation):
-    class Arguments:
-        input = graphene.List(CustomerInput, required=True)
-
-    customers = graphene.List(CustomerType)
-    errors = graphene.List(graphene.String)
-
-    @transaction.atomic
-    def mutate(self, info, input):
-        customers = []
-        errors = []
-
-        for data in input:
-            try:
-                if Customer.objects.filter(email=data.email).exists():
-                    raise Exception(f"Email already exists: {data.email}")
-                if data.phone and not re.match(r'^(\+\d{10,15}|\d{3}-\d{3}-\d{4})$', data.phone):
-                    raise Exception(f"Invalid phone format: {data.phone}")
-
-                customers.append(Customer(
-                    name=data.name,
-                    email=data.email,
-                    phone=data.phone
-                ))
-            except Exception as e:
-                errors.append(str(e))
-
-        created_customers = Customer.objects.bulk_create(customers)
-        return BulkCreateCustomers(customers=created_customers, errors=errors)
-class CreateProduct(graphene.Mutation):
-    class Arguments:
-        input = ProductInput(required=True)
+class ProductStockChangedEvent(graphene.ObjectType):
+    id = graphene.ID()
+    name = graphene.String()
+    stock = graphene.Int()
+    previous_stock = graphene.Int()
 
-    product = graphene.Field(ProductType)
 
-    def mutate(self, info, input):
-        if input.price <= 0:
-            raise Exception("Price must be positive")
-        if input.stock < 0:
-            raise Exception("Stock must be non-negative")
+class Subscription(graphene.ObjectType):
+    order_created = graphene.Field(OrderCreatedEvent, customer_id=graphene.ID())
+    product_stock_changed = graphene.Field(ProductStockChangedEvent, product_id=graphene.ID())
 
-        product = Product.objects.create(
-            name=input.name,
-            price=Decimal(input.price),
-            stock=input.stock
-        )
-        return CreateProduct(product=product)
-class CreateOrder(graphene.Mutation):
-    class Arguments:
-        input = OrderInput(required=True)
-
-    order = graphene.Field(OrderType)
-
-    def mutate(self, info, input):
-        try:
-            customer = Customer.objects.get(pk=input.customer_id)
-        except Customer.DoesNotExist:
-            raise Exception("Customer not found")
-
-        products = Product.objects.filter(pk__in=input.product_ids)
-        if not products.exists():
-            raise Exception("No valid products found")
-
-        total_amount = sum([p.price for p in products])
-
-        order = Order.objects.create(
-            customer=customer,
-            total_amount=total_amount,
-            order_date=input.order_date or datetime.now()
-        )
-        order.products.set(products)
-
-        return CreateOrder(order=order)
-
-class UpdateLowStockProducts(graphene.Mutation):
-    class Arguments:
-        pass  # no input needed
-
-    success = graphene.Boolean()
-    message = graphene.String()
-    products = graphene.List(ProductType)
-
-    def mutate(self, info):
-        low_stock_products = Product.objects.filter(stock__lt=10)
-        updated_products = []
-
-        for product in low_stock_products:
-            product.stock += 10
-            product.save()
-            updated_products.append(product)
-
-        return UpdateLowStockProducts(
-            success=True,
-            message="Low stock products restocked successfully.",
-            products=updated_products,
-        )
-
-class Mutation(graphene.ObjectType):
-    create_customer = CreateCustomer.Field()
-    bulk_create_customers = BulkCreateCustomers.Field()
-    create_product = CreateProduct.Field()
-    create_order = CreateOrder.Field()
+    async def subscribe_order_created(root, info, customer_id=None):
+        async for event in listen(ORDER_CREATED):
+            if customer_id is None or str(event["customer_id"]) == str(customer_id):
+                yield event
 
+    async def subscribe_product_stock_changed(root, info, product_id=None):
+        async for event in listen(PRODUCT_STOCK_CHANGED):
+            if product_id is None or str(event["id"]) == str(product_id):
+                yield event
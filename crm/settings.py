@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from celery.schedules import crontab
 
@@ -49,14 +50,85 @@ CRONJOBS = [
     ("*/5 * * * *", "crm.cron.log_crm_heartbeat"),
 ]
 
+# Celery. For local testing without Redis run with
+# CELERY_BROKER_URL=memory:// CELERY_RESULT_BACKEND=cache+memory:// CELERY_TASK_ALWAYS_EAGER=1
+# so jobs execute in-process.
+CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379/0")
+CELERY_TASK_ALWAYS_EAGER = os.environ.get("CELERY_TASK_ALWAYS_EAGER", "") == "1"
+CELERY_TASK_EAGER_PROPAGATES = True
+# Chunked jobs (crm.chunking) join their parts with a chord, which needs a result backend.
+CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND", "redis://localhost:6379/1")
+# Primary keys per chunk task for reports, cleanups and restocks.
+CRM_TASK_CHUNK_SIZE = 10_000
+# Largest bulkCreateCustomers(runAsync: true) batch accepted for one job.
+CRM_BULK_MAX_ROWS = 100_000
+
 # Celery Beat schedule
 CELERY_BEAT_SCHEDULE = {
     "generate-crm-report": {
         "task": "crm.tasks.generate_crm_report",
         "schedule": crontab(day_of_week="mon", hour=6, minute=0),
     },
+    "purge-idempotency-keys": {
+        "task": "crm.tasks.purge_expired_idempotency_keys",
+        "schedule": crontab(minute=15),
+    },
+    "archive-old-orders": {
+        "task": "crm.tasks.archive_old_orders",
+        "schedule": crontab(hour=3, minute=30),
+    },
+    "clean-inactive-customers": {
+        "task": "crm.tasks.clean_inactive_customers",
+        "schedule": crontab(day_of_week="sun", hour=2, minute=0),
+    },
 }
 
+# Job-run log (crm.joblog): runs are buffered and bulk-written to JobRun. Set
+# CRM_JOBLOG_FILE to also write JSON lines, rotated at CRM_JOBLOG_MAX_BYTES.
+CRM_JOBLOG_FILE = os.environ.get("CRM_JOBLOG_FILE") or None
+CRM_JOBLOG_MAX_BYTES = 10 * 1024 * 1024
+CRM_JOBLOG_BACKUPS = 5
+CRM_JOBLOG_BUFFER = 20           # runs per bulk write
+CRM_JOBLOG_FLUSH_INTERVAL = 60   # seconds a run may wait in the buffer
+
+# Health checks (crm.health). /healthz caches its DB probe for CRM_HEALTH_DB_TTL
+# seconds; /readyz fails above CRM_HEALTH_MAX_QUEUE_DEPTH queued tasks. The cron
+# heartbeat polls CRM_HEALTH_URL.
+CRM_HEALTH_DB_TTL = 5
+CRM_HEALTH_MAX_QUEUE_DEPTH = 10_000
+CRM_HEALTH_URL = os.environ.get("CRM_HEALTH_URL", "http://localhost:8000/readyz")
+
+# In-process product price/stock snapshot (crm.catalog) used by createOrder.
+# Other processes' changes are picked up within CRM_CATALOG_TTL seconds.
+CRM_CATALOG_MAX_BYTES = 16 * 1024 * 1024
+CRM_CATALOG_TTL = 5
+
+# Orders older than this many days are moved to ArchivedOrder by the nightly
+# archive_old_orders task; query them with orders(includeArchived: true).
+CRM_ORDER_ARCHIVE_DAYS = 365
+
+# Serve scalar-only customers/products/orders list queries from values_list()
+# rows encoded with orjson instead of graphene objects (crm.fastpath).
+CRM_GRAPHQL_FAST_PATH = True
+
+# Largest `first` accepted by the customers/products/orders listings. Requests
+# without `first` still get graphene's default page (RELAY_CONNECTION_MAX_LIMIT).
+CRM_GRAPHQL_MAX_ROWS = 100_000
+
+# Rows per payload when a listing is streamed with @stream/@defer to a client
+# that accepts multipart/mixed (crm.incremental).
+CRM_GRAPHQL_STREAM_BATCH = 500
+
+# How long (seconds) a mutation's idempotencyKey result is kept for replay.
+CRM_IDEMPOTENCY_TTL = 24 * 60 * 60
+# How long (seconds) a claim whose request died blocks its key before another
+# request may take it over. Running mutations renew it every third of a lease.
+CRM_IDEMPOTENCY_LEASE = 60
+
+# GraphQL subscriptions pub/sub. Use "crm.pubsub.RedisBroker" when running
+# more than one ASGI worker so events reach every node.
+CRM_PUBSUB_BROKER = "crm.pubsub.InMemoryBroker"
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -65,8 +137,22 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'crm.ratelimit.GraphQLRateLimitMiddleware',
 ]
 
+# Per-client token buckets for /graphql. Requests consume tokens by estimated
+# cost. Use "crm.ratelimit.CacheStore" with a shared cache to enforce limits
+# across workers.
+CRM_RATE_LIMITS = {
+    "query": {"rate": 20.0, "burst": 100},
+    "mutation": {"rate": 2.0, "burst": 20},
+    "concurrency": 4,
+}
+CRM_RATELIMIT_STORE = "crm.ratelimit.LocalStore"
+# API keys that get their own bucket when sent as X-API-Key (comma-separated in
+# the environment). Other clients are limited per user, else per IP address.
+CRM_API_KEYS = [key for key in os.environ.get("CRM_API_KEYS", "").split(",") if key]
+
 ROOT_URLCONF = 'alx_backend_graphql_crm.urls'
 
 TEMPLATES = [
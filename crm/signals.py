@@ -0,0 +1,70 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import catalog
+from .models import Order, Product
+from .pubsub import ORDER_CREATED, PRODUCT_STOCK_CHANGED, publish
+
+
+@receiver(post_init, sender=Product)
+def remember_product_stock(sender, instance, **kwargs):
+    instance._loaded_stock = instance.__dict__.get("stock")
+
+
+@receiver(post_save, sender=Order)
+def order_created(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    # Defer until commit so totals/products set later in the same transaction are included.
+    def _publish():
+        publish(ORDER_CREATED, {
+            "id": instance.pk,
+            "customer_id": instance.customer_id,
+            "total_amount": instance.total_amount,
+            "order_date": instance.order_date,
+        })
+
+    transaction.on_commit(_publish)
+
+
+@receiver(post_save, sender=Product)
+def product_stock_changed(sender, instance, created, **kwargs):
+    previous = None if created else getattr(instance, "_loaded_stock", None)
+    if not created and previous == instance.stock:
+        return
+    instance._loaded_stock = instance.stock
+
+    payload = {
+        "id": instance.pk,
+        "name": instance.name,
+        "stock": instance.stock,
+        "previous_stock": previous,
+    }
+    # Keyed by product so bursts of restocks collapse to the latest level per subscriber.
+    transaction.on_commit(lambda: publish(PRODUCT_STOCK_CHANGED, payload, key=payload["id"]))
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    pid, price, stock = instance.pk, instance.price, instance.stock
+
+    def _apply():
+        snapshot = catalog.loaded_catalog()
+        if snapshot is not None:
+            snapshot.put(pid, price, stock)
+
+    transaction.on_commit(_apply)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    pid = instance.pk
+
+    def _apply():
+        snapshot = catalog.loaded_catalog()
+        if snapshot is not None:
+            snapshot.remove(pid)
+
+    transaction.on_commit(_apply)
@@ -1,49 +1,233 @@
 import datetime
-import asyncio
+from decimal import Decimal
+
 from celery import shared_task
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
-from datetime import datetime
-import requests
+from django.db.models import Count, Sum
+
+from .chunking import CHUNK_RETRY, chunk_signatures, fan_out, merge_totals
+
+
+def record_run(name, started_at, rows=0, details=None, error=None):
+    """Log a fanned-out job as one JobRun spanning dispatch to merge; ``started_at`` is ISO 8601."""
+    from django.utils.dateparse import parse_datetime
+
+    from .joblog import RunRecord, record
+
+    run = RunRecord(name, started_at=parse_datetime(started_at))
+    run.rows = rows
+    run.details = details or {}
+    if error:
+        run.fail(error)
+    record(run)
+
+
+def now_iso():
+    from django.utils import timezone
+
+    return timezone.now().isoformat()
 
 
+@shared_task
+def fail_job(request, exc, traceback, job_id):
+    """Errback for fanned-out jobs: mark the Job failed when a chunk gives up."""
+    from .models import Job
+
+    Job.objects.get(pk=job_id).finish(error=str(exc))
+
+
+@shared_task
+def fail_run(request, exc, traceback, name, started_at):
+    """Errback for fanned-out jobs without a Job: log the failed run."""
+    record_run(name, started_at, error=exc)
+
+
+# ------------------------
+# Weekly report
+# ------------------------
 @shared_task
 def generate_crm_report():
-    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    try:
-        result = asyncio.run(fetch_report_data())
-        customers = result["customers"]["totalCount"]
-        orders = result["orders"]["totalCount"]
-        revenue = result["orders"]["totalRevenue"]
+    """Count customers, orders and revenue in parallel ID-range chunks; crm_report_merge records the totals."""
+    from .models import Customer, Order
 
-        log_message = f"{now} - Report: {customers} customers, {orders} orders, {revenue} revenue\n"
+    started_at = now_iso()
+    try:
+        fan_out(
+            chunk_signatures(crm_report_chunk, Customer.objects.all(), model="customer")
+            + chunk_signatures(crm_report_chunk, Order.objects.all(), model="order"),
+            crm_report_merge.s(started_at=started_at),
+            on_error=fail_run.s("generate_crm_report", started_at),
+        )
     except Exception as e:
-        log_message = f"{now} - Error generating report: {e}\n"
+        record_run("generate_crm_report", started_at, error=e)
+
+
+@shared_task(**CHUNK_RETRY)
+def crm_report_chunk(lo, hi, model):
+    from .models import Customer, Order
+
+    if model == "customer":
+        return {"customers": Customer.objects.filter(pk__range=(lo, hi)).count()}
+    totals = Order.objects.filter(pk__range=(lo, hi)).aggregate(orders=Count("pk"), revenue=Sum("total_amount"))
+    return {"orders": totals["orders"], "revenue": str(totals["revenue"] or 0)}
+
+
+@shared_task
+def crm_report_merge(parts, started_at):
+    totals = merge_totals(parts, decimal_keys=("revenue",))
+    totals.setdefault("customers", 0)
+    totals.setdefault("orders", 0)
+    totals["revenue"] = str(Decimal(totals["revenue"]).quantize(Decimal("0.01")))
+    record_run("generate_crm_report", started_at, rows=totals["customers"] + totals["orders"],
+               details={**totals, "chunks": len(parts)})
+    return totals
+
 
-    with open("/tmp/crm_report_log.txt", "a") as log_file:
-        log_file.write(log_message)
+# ------------------------
+# Maintenance
+# ------------------------
+@shared_task
+def clean_inactive_customers(days=365):
+    """Delete customers with no orders created more than ``days`` ago, one chunk task per ID range."""
+    from django.utils import timezone
 
+    from .models import Customer
 
-async def fetch_report_data():
-    transport = RequestsHTTPTransport(
-        url="http://localhost:8000/graphql",
-        verify=True,
-        retries=3,
+    started_at = now_iso()
+    cutoff = (timezone.now() - datetime.timedelta(days=days)).isoformat()
+    inactive = Customer.objects.filter(order_count=0, created_at__lt=cutoff)
+    fan_out(
+        chunk_signatures(clean_inactive_customers_chunk, inactive, cutoff=cutoff),
+        clean_inactive_customers_merge.s(started_at=started_at),
+        on_error=fail_run.s("clean_inactive_customers", started_at),
     )
-    client = Client(transport=transport, fetch_schema_from_transport=True)
-
-    query = gql(
-        """
-        query {
-            customers {
-                totalCount
-            }
-            orders {
-                totalCount
-                totalRevenue
-            }
-        }
-        """
+
+
+@shared_task(**CHUNK_RETRY)
+def clean_inactive_customers_chunk(lo, hi, cutoff):
+    from .models import Customer
+
+    _, per_model = Customer.objects.filter(pk__range=(lo, hi), order_count=0, created_at__lt=cutoff).delete()
+    return {"deleted": per_model.get(Customer._meta.label, 0)}
+
+
+@shared_task
+def clean_inactive_customers_merge(parts, started_at):
+    totals = merge_totals(parts)
+    record_run("clean_inactive_customers", started_at, rows=totals.get("deleted", 0),
+               details={"chunks": len(parts)})
+    return totals
+
+
+@shared_task
+def archive_old_orders(days=None, batch_size=1000):
+    """Move orders older than the archive horizon to ArchivedOrder, one chunk task per ID range."""
+    from .archive import cutoff
+    from .models import Order
+
+    started_at = now_iso()
+    before = cutoff(days).isoformat()
+    fan_out(
+        chunk_signatures(archive_orders_chunk, Order.objects.filter(order_date__lt=before),
+                         before=before, batch_size=batch_size),
+        archive_orders_merge.s(started_at=started_at),
+        on_error=fail_run.s("archive_old_orders", started_at),
     )
 
-    return await client.execute_async(query)
+
+@shared_task(**CHUNK_RETRY)
+def archive_orders_chunk(lo, hi, before, batch_size):
+    from django.utils.dateparse import parse_datetime
+
+    from .archive import archive_range
+
+    return {"archived": sum(archive_range(parse_datetime(before), lo, hi, batch_size))}
+
+
+@shared_task
+def archive_orders_merge(parts, started_at):
+    totals = merge_totals(parts)
+    record_run("archive_old_orders", started_at, rows=totals.get("archived", 0), details={"chunks": len(parts)})
+    return totals
+
+
+# ------------------------
+# Async mutation jobs
+# ------------------------
+@shared_task
+def bulk_create_customers_job(job_id, rows, batch_size=500):
+    from .bulk import bulk_create_customers
+    from .models import Job
+
+    job = Job.objects.get(pk=job_id)
+    job.start()
+    try:
+        for offset in range(0, len(rows), batch_size):
+            created, errors = bulk_create_customers(rows[offset:offset + batch_size], start=offset + 1)
+            job.advance(
+                len(rows[offset:offset + batch_size]),
+                errors=[str(e) for e in errors],
+                customer_ids=[c.pk for c in created],
+            )
+    except Exception as e:
+        job.finish(error=str(e))
+        raise
+    job.finish()
+
+
+@shared_task
+def restock_low_stock_job(job_id, threshold=10, amount=10, batch_size=500):
+    from .models import Job, Product
+
+    job = Job.objects.get(pk=job_id)
+    low_stock = Product.objects.filter(stock__lt=threshold)
+    job.total = low_stock.count()
+    job.save(update_fields=["total"])
+    job.start()
+    try:
+        fan_out(
+            chunk_signatures(
+                restock_low_stock_chunk, low_stock,
+                job_id=job_id, threshold=threshold, amount=amount, batch_size=batch_size,
+            ),
+            restock_low_stock_merge.s(job_id),
+            on_error=fail_job.s(job_id),
+        )
+    except Exception as e:
+        job.finish(error=str(e))
+        raise
+
+
+@shared_task(**CHUNK_RETRY)
+def restock_low_stock_chunk(lo, hi, job_id, threshold, amount, batch_size):
+    from django.db import transaction
+    from django.db.models import F
+
+    from .bulk import restock_low_stock
+    from .models import Job
+
+    # One transaction per chunk, so a retried chunk never restocks a product twice.
+    with transaction.atomic():
+        ids = [
+            pid
+            for batch in restock_low_stock(threshold, amount, batch_size, start_id=lo, end_id=hi)
+            for pid, _, _ in batch
+        ]
+        Job.objects.filter(pk=job_id).update(processed=F("processed") + len(ids))
+    return {"product_ids": ids}
+
+
+@shared_task
+def restock_low_stock_merge(parts, job_id):
+    from .models import Job
+
+    job = Job.objects.get(pk=job_id)
+    job.result["product_ids"] = merge_totals(parts).get("product_ids", [])
+    job.save(update_fields=["result", "updated_at"])
+    job.finish()
+
+
+@shared_task
+def purge_expired_idempotency_keys():
+    from .idempotency import purge_expired
+
+    return purge_expired()
@@ -1,3 +1,954 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import re
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase
+
+from graphql_crm.schema import get_schema
+
+from . import catalog, fastpath, incremental, joblog, pubsub
+from .health import latency_alert
+from .joblog import JobRunLog, RunRecord
+from .archive import archive_range, cutoff
+from .chunking import fan_out, id_ranges, merge_totals
+from .models import ArchivedOrder, Customer, Job, JobRun, Order, Product
+from .ratelimit import get_store, graphql_params
+from .views import CRMGraphQLView
+
+PROJECT_ROOT = str(Path(__file__).resolve().parent.parent)
+
+
+# ------------------------
+# Query-count harness
+# ------------------------
+class QueryRecorder:
+    """Records every SQL statement with the call stack that issued it."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((sql, traceback.extract_stack()[:-1]))
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+
+def relevant_frames(stack, limit=6):
+    """Project frames if any issued the query, else the innermost non-ORM frames (e.g. graphene resolvers)."""
+    project = [f for f in stack if f.filename.startswith(PROJECT_ROOT) and not f.filename.endswith("tests.py")]
+    if project:
+        return project[-limit:]
+    outside_orm = [f for f in stack if "/django/db/" not in f.filename and "/django/test/" not in f.filename]
+    return outside_orm[-limit:]
+
+
+def normalize_sql(sql):
+    # Collapse literals and IN-lists so the same statement at two sizes compares equal.
+    sql = re.sub(r"\bIN \([^)]*\)", "IN (...)", sql)
+    return re.sub(r"\b\d+\b", "?", sql)
+
+
+class QueryCountTestCase(TestCase):
+    """
+    ``assertConstantQueries(seed, operation)`` seeds the database at two sizes,
+    runs the operation against each and fails if the SQL query count differs,
+    listing the extra statements and where they were issued from.
+    """
+
+    sizes = (3, 20)
+
+    def execute(self, query, variables=None):
+        result = get_schema().execute(query, variables=variables)
+        self.assertIsNone(result.errors, result.errors)
+        return result.data
+
+    def record(self, seed, operation, size):
+        recorder = QueryRecorder()
+        catalog.reset()  # each size starts from a cold snapshot
+        with transaction.atomic():
+            context = seed(size)
+            with connection.execute_wrapper(recorder):
+                operation(context)
+            transaction.set_rollback(True)
+        return recorder
+
+    def assertConstantQueries(self, seed, operation):
+        small, large = (self.record(seed, operation, size) for size in self.sizes)
+        if len(small) == len(large):
+            return
+
+        extra = Counter(normalize_sql(sql) for sql, _ in large.queries)
+        extra.subtract(normalize_sql(sql) for sql, _ in small.queries)
+        lines = [
+            f"Query count grew with data size: {len(small)} queries at size {self.sizes[0]}, "
+            f"{len(large)} at size {self.sizes[1]}."
+        ]
+        reported = set()
+        for sql, stack in large.queries:
+            key = normalize_sql(sql)
+            if extra[key] > 0 and key not in reported:
+                reported.add(key)
+                lines.append(f"\n+{extra[key]} x {sql}")
+                lines.extend("    " + line.rstrip() for line in traceback.format_list(relevant_frames(stack)))
+        self.fail("\n".join(lines))
+
+
+class FlushJobLogMixin:
+    """Write job runs left in the process-wide buffer while this test's transaction can still roll them back."""
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(joblog.flush)
+
+
+# ------------------------
+# Fixtures
+# ------------------------
+def make_customers(n, prefix="c"):
+    return Customer.objects.bulk_create(
+        Customer(name=f"Customer {i}", email=f"{prefix}{i}@example.com", phone="+12345678901") for i in range(n)
+    )
+
+
+def make_products(n, stock=50):
+    return Product.objects.bulk_create(
+        Product(name=f"Product {i}", price=Decimal("9.99"), stock=stock) for i in range(n)
+    )
+
+
+def make_orders(n):
+    customers = make_customers(n, prefix="o")
+    products = make_products(3)
+    for customer in customers:
+        order = Order.objects.create(customer=customer, total_amount=Decimal("29.97"))
+        order.products.set(products)
+    return customers
+
+
+def make_archived_orders(n):
+    customers = make_orders(n)
+    # Every other order is past the horizon and gets archived.
+    Order.objects.filter(customer__in=customers[::2]).update(order_date=cutoff() - timedelta(days=1))
+    list(archive_range(cutoff()))
+    return customers
+
+
+def make_job_runs(n, log=None):
+    log = log or JobRunLog(buffer_size=n + 1)
+    for i in range(n):
+        run = RunRecord("update_low_stock")
+        run.rows = i
+        if i % 3 == 0:
+            run.fail("boom")
+        log.add(run.finish())
+    log.flush()
+
+
+class QueryResolverQueryCountTests(QueryCountTestCase):
+    def test_hello(self):
+        self.assertConstantQueries(lambda n: None, lambda _: self.execute("{ hello }"))
+
+    def test_customers(self):
+        self.assertConstantQueries(
+            make_customers,
+            lambda _: self.execute(
+                '{ customers(orderBy: "-lifetime_value") { totalCount edges { node { id name email orderCount } } } }'
+            ),
+        )
+
+    def test_products(self):
+        self.assertConstantQueries(
+            make_products,
+            lambda _: self.execute("{ products(stock_Gte: 1) { totalCount edges { node { id name price stock } } } }"),
+        )
+
+    def test_orders_with_nested_customer_and_products(self):
+        self.assertConstantQueries(
+            make_orders,
+            lambda _: self.execute(
+                "{ orders { totalCount totalRevenue edges { node { id totalAmount "
+                "customer { id name } products { id name price } } } } }"
+            ),
+        )
+
+    def test_orders_including_archived(self):
+        self.assertConstantQueries(
+            make_archived_orders,
+            lambda _: self.execute(
+                "{ orders(includeArchived: true, first: 100) { totalCount totalRevenue edges { node { id totalAmount "
+                "customer { id name } products { id name price } } } } }"
+            ),
+        )
+
+    def test_job(self):
+        def seed(n):
+            return Job.objects.create(kind="bulk_create_customers", total=n, processed=n,
+                                      result={"customer_ids": list(range(n))}, errors=["x"] * n)
+
+        self.assertConstantQueries(
+            seed,
+            lambda job: self.execute(
+                "query($id: UUID!) { job(id: $id) { status progress total processed result errors } }",
+                {"id": str(job.pk)},
+            ),
+        )
+
+    def test_job_runs(self):
+        self.assertConstantQueries(
+            make_job_runs,
+            lambda _: self.execute(
+                '{ jobRuns(name: "update_low_stock", status: FAILED) '
+                "{ totalCount edges { node { name status durationMs rows errorCount errors details } } } }"
+            ),
+        )
+
+    def test_job_run_trends(self):
+        self.assertConstantQueries(
+            make_job_runs,
+            lambda _: self.execute("{ jobRunTrends(days: 7) { name day runs failures avgDurationMs maxDurationMs rows } }"),
+        )
+
+
+class MutationQueryCountTests(FlushJobLogMixin, QueryCountTestCase):
+    def test_create_customer(self):
+        counter = iter(range(100))
+        self.assertConstantQueries(
+            make_customers,
+            lambda _: self.execute(
+                "mutation($email: String!) { createCustomer(input: {name: \"N\", email: $email}) "
+                "{ customer { id } errors } }",
+                {"email": f"new{next(counter)}@example.com"},
+            ),
+        )
+
+    def test_bulk_create_customers(self):
+        def seed(n):
+            make_customers(n)
+            # Half the payload collides with existing rows to exercise the error path.
+            return [{"name": f"B{i}", "email": f"{'c' if i % 2 else 'b'}{i}@example.com"} for i in range(n)]
+
+        self.assertConstantQueries(
+            seed,
+            lambda rows: self.execute(
+                "mutation($input: [CreateCustomerInput]!) { bulkCreateCustomers(input: $input) "
+                "{ customers { id email } errors } }",
+                {"input": rows},
+            ),
+        )
+
+    def test_bulk_create_customers_async(self):
+        def seed(n):
+            return [{"name": f"B{i}", "email": f"b{i}@example.com"} for i in range(n)]
+
+        def operation(rows):
+            with self.captureOnCommitCallbacks(execute=False):
+                self.execute(
+                    "mutation($input: [CreateCustomerInput]!) { bulkCreateCustomers(input: $input, runAsync: true) "
+                    "{ job { id status total } } }",
+                    {"input": rows},
+                )
+
+        self.assertConstantQueries(seed, operation)
+
+    def test_create_product(self):
+        self.assertConstantQueries(
+            make_products,
+            lambda _: self.execute(
+                'mutation { createProduct(input: {name: "P", price: "4.50", stock: 3}) { product { id price } errors } }'
+            ),
+        )
+
+    def test_create_order(self):
+        def seed(n):
+            return make_customers(1)[0], make_products(n)
+
+        self.assertConstantQueries(
+            seed,
+            lambda ctx: self.execute(
+                "mutation($c: ID!, $p: [ID]!) { createOrder(input: {customerId: $c, productIds: $p}) "
+                "{ order { id totalAmount customer { id orderCount } products { id price } } errors } }",
+                {"c": ctx[0].pk, "p": [p.pk for p in ctx[1]]},
+            ),
+        )
+
+    def test_update_low_stock_products(self):
+        self.assertConstantQueries(
+            lambda n: make_products(n, stock=2),
+            lambda _: self.execute("mutation { updateLowStockProducts { success products { id stock } } }"),
+        )
+
+
+class SubscriptionEventTests(TestCase):
+    def test_stock_changes_publish_on_commit_only_when_stock_moves(self):
+        product = make_products(1, stock=5)[0]
+        product = Product.objects.get(pk=product.pk)
+        with mock.patch("crm.signals.publish") as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                product.name = "Renamed"
+                product.save()
+                product.stock = 2
+                product.save()
+                self.assertEqual(publish.call_count, 0)  # held until commit
+        publish.assert_called_once_with(
+            pubsub.PRODUCT_STOCK_CHANGED,
+            {"id": product.pk, "name": "Renamed", "stock": 2, "previous_stock": 5},
+            key=product.pk,
+        )
+
+    def test_keyed_events_coalesce_per_subscriber(self):
+        async def receive():
+            broker = pubsub.InMemoryBroker()
+            sub = broker.subscribe(pubsub.PRODUCT_STOCK_CHANGED)
+            for stock in (3, 2, 1):
+                broker.publish(pubsub.PRODUCT_STOCK_CHANGED, {"id": 1, "stock": stock}, key=1)
+            broker.publish(pubsub.PRODUCT_STOCK_CHANGED, {"id": 2, "stock": 7}, key=2)
+            events = aiter(sub)
+            received = [await anext(events), await anext(events)]
+            broker.unsubscribe(pubsub.PRODUCT_STOCK_CHANGED, sub)
+            return received
+
+        self.assertEqual(asyncio.run(receive()), [{"id": 1, "stock": 1}, {"id": 2, "stock": 7}])
+
+
+class CustomerAggregateTests(QueryCountTestCase):
+    create_order = "mutation($c: ID!, $p: [ID]!) { createOrder(input: {customerId: $c, productIds: $p}) { errors } }"
+
+    def test_orders_update_counters_and_reconcile_repairs_drift(self):
+        customers, products = make_customers(2), make_products(2)
+        for product_ids in ([products[0].pk], [p.pk for p in products]):
+            self.execute(self.create_order, {"c": customers[0].pk, "p": product_ids})
+
+        customer = Customer.objects.get(pk=customers[0].pk)
+        self.assertEqual((customer.order_count, customer.lifetime_value), (2, Decimal("29.97")))
+        self.assertEqual(customer.last_order_at, Order.objects.latest("order_date").order_date)
+        result = self.execute("{ customers(hasOrders: true) { edges { node { id orderCount } } } }")
+        self.assertEqual(result["customers"]["edges"], [{"node": {"id": str(customer.pk), "orderCount": 2}}])
+
+        Customer.objects.filter(pk=customers[0].pk).update(order_count=7, lifetime_value=0)
+        Customer.objects.filter(pk=customers[1].pk).update(order_count=1)
+        call_command("reconcile_customer_aggregates", chunk_size=1, stdout=io.StringIO())
+        self.assertEqual(
+            list(Customer.objects.order_by("pk").values_list("order_count", "lifetime_value")),
+            [(2, Decimal("29.97")), (0, Decimal("0.00"))],
+        )
+
+
+class ExportTests(TestCase):
+    def test_filtered_export_streams_csv_and_ndjson(self):
+        make_products(3, stock=50)
+        Product.objects.create(name="Scarce", price=Decimal("5.00"), stock=2)
+
+        response = self.client.get("/export/products", {"format": "csv", "stock__lte": 10})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "id,name,price,stock")
+        self.assertEqual([line.split(",")[1:] for line in lines[1:]], [["Scarce", "5.00", "2"]])
+
+        response = self.client.get("/export/products", {"format": "ndjson"})
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([row["name"] for row in rows], ["Product 0", "Product 1", "Product 2", "Scarce"])
+
+    async def test_export_streams_under_asgi(self):
+        await sync_to_async(make_products)(3)
+        response = await self.async_client.get("/export/products", {"format": "ndjson"})
+        self.assertTrue(response.is_async)  # a sync body would be read whole before sending
+        rows = [json.loads(line) async for chunk in response.streaming_content for line in chunk.splitlines()]
+        self.assertEqual(len(rows), 3)
+
+    def test_unknown_resource_or_format_is_rejected(self):
+        self.assertEqual(self.client.get("/export/invoices").status_code, 400)
+        self.assertEqual(self.client.get("/export/products", {"format": "xml"}).status_code, 400)
+
+
+class JobTests(FlushJobLogMixin, QueryCountTestCase):
+    bulk_create = (
+        "mutation($input: [CreateCustomerInput]!) { bulkCreateCustomers(input: $input, runAsync: true) "
+        "{ errors job { id } } }"
+    )
+
+    def run_job(self, rows, batch_size=2):
+        from .tasks import bulk_create_customers_job
+
+        job = Job.objects.create(kind="bulk_create_customers", total=len(rows))
+        bulk_create_customers_job(str(job.pk), rows, batch_size=batch_size)
+        return Job.objects.get(pk=job.pk)
+
+    def test_progress_results_and_capped_errors(self):
+        rows = [{"name": f"N{i}", "email": f"n{i}@example.com" if i % 2 else "bad"} for i in range(7)]
+        with mock.patch.object(Job, "MAX_ERRORS", 2):
+            job = self.run_job(rows)
+
+        self.assertEqual((job.status, job.processed, job.progress), (Job.SUCCEEDED, 7, 1.0))
+        self.assertEqual(len(job.result["customer_ids"]), 3)
+        self.assertEqual((job.error_count, len(job.errors)), (4, 2))
+        self.assertTrue(job.errors[0].startswith("[1] Invalid email address"))
+
+    def test_failed_batch_marks_job_failed_after_partial_progress(self):
+        from .bulk import bulk_create_customers
+
+        def fail_second_batch(rows, start=1):
+            if start > 1:
+                raise RuntimeError("database went away")
+            return bulk_create_customers(rows, start=start)
+
+        rows = [{"name": f"N{i}", "email": f"n{i}@example.com"} for i in range(4)]
+        with mock.patch("crm.bulk.bulk_create_customers", fail_second_batch), self.assertRaises(RuntimeError):
+            self.run_job(rows)
+
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.processed, job.error_count), (Job.FAILED, 2, 1))
+        self.assertEqual(job.errors, ["database went away"])
+        self.assertIsNotNone(job.finished_at)
+
+    def test_bad_batches_are_rejected_before_enqueue(self):
+        rows = [{"name": "Ada", "email": "ada@example.com"}, {"name": " ", "email": "b@example.com"}]
+        result = self.execute(self.bulk_create, {"input": rows})["bulkCreateCustomers"]
+        self.assertEqual((result["errors"], result["job"]), (["[2] Name is required"], None))
+
+        with self.settings(CRM_BULK_MAX_ROWS=1):
+            result = self.execute(self.bulk_create, {"input": rows[:1] * 2})["bulkCreateCustomers"]
+        self.assertIn("Too many rows", result["errors"][0])
+        self.assertFalse(Job.objects.exists())
+
+
+class BulkCustomerTests(TestCase):
+    def test_email_taken_after_validation_fails_only_its_row(self):
+        from .bulk import bulk_create_customers
+        from .validation import customer_validator
+
+        rows = [{"name": f"N{i}", "email": f"n{i}@example.com"} for i in range(3)]
+        # Another request inserts n1@ between the validator's lookup and the insert.
+        with mock.patch.object(customer_validator, "existing", return_value=set()):
+            Customer.objects.create(name="Racer", email="n1@example.com")
+            created, errors = bulk_create_customers(rows)
+
+        self.assertEqual([c.email for c in created], ["n0@example.com", "n2@example.com"])
+        self.assertEqual([(e.row, e.field, e.message) for e in errors], [(2, "email", "Email already exists")])
+        self.assertEqual(Customer.objects.count(), 3)
+
+
+class ChunkingTests(FlushJobLogMixin, TestCase):
+    def test_id_ranges_cover_the_key_span(self):
+        ids = [c.pk for c in make_customers(5)]
+        self.assertEqual(
+            id_ranges(Customer.objects.all(), size=2),
+            [(ids[0], ids[1]), (ids[2], ids[3]), (ids[4], ids[4])],
+        )
+        self.assertEqual(id_ranges(Customer.objects.filter(pk__gte=ids[3]), size=10), [(ids[3], ids[4])])
+        self.assertEqual(id_ranges(Customer.objects.none()), [])
+
+    def test_merge_totals_sums_numbers_decimals_and_lists(self):
+        parts = [{"orders": 2, "ids": [1], "revenue": "1.50"}, None, {"orders": 3, "ids": [2, 3], "revenue": "2.25"}]
+        self.assertEqual(
+            merge_totals(parts, decimal_keys=("revenue",)),
+            {"orders": 5, "ids": [1, 2, 3], "revenue": "3.75"},
+        )
+        self.assertEqual(merge_totals([], decimal_keys=("revenue",)), {"revenue": "0.00"})
+
+    def test_fan_out_links_the_errback_to_the_merge_callback(self):
+        callback, errback = mock.Mock(), mock.Mock()
+        with mock.patch("crm.chunking.chord") as chord:
+            fan_out(["chunk-1", "chunk-2"], callback, on_error=errback)
+        callback.on_error.assert_called_once_with(errback)
+        chord.assert_called_once_with(["chunk-1", "chunk-2"])
+        chord.return_value.assert_called_once_with(callback.on_error.return_value)
+
+        # No chunks: the callback still runs, with no parts.
+        fan_out([], callback)
+        callback.delay.assert_called_once_with([])
+
+    def test_errbacks_record_the_failure(self):
+        from .tasks import fail_job, fail_run, now_iso
+
+        job = Job.objects.create(kind="restock_low_stock", total=10)
+        job.start()
+        fail_job(None, RuntimeError("chunk gave up"), None, str(job.pk))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.errors, job.error_count), (Job.FAILED, ["chunk gave up"], 1))
+
+        fail_run(None, RuntimeError("chunk gave up"), None, "clean_inactive_customers", now_iso())
+        joblog.flush()
+        run = JobRun.objects.get(name="clean_inactive_customers")
+        self.assertEqual((run.status, run.errors), (JobRun.FAILED, ["chunk gave up"]))
+
+
+class WebSocketProtocolTests(TestCase):
+    subscribe = {"type": "subscribe", "id": "1", "payload": {"query": "subscription { orderCreated { id } }"}}
+
+    def converse(self, *messages):
+        """Send ``messages`` over a fresh connection; return what the server sent, ending with its close."""
+        from .websocket import PROTOCOL, GraphQLWebSocketApp
+
+        async def run():
+            incoming = asyncio.Queue()
+            incoming.put_nowait({"type": "websocket.connect"})
+            for message in messages:
+                incoming.put_nowait({"type": "websocket.receive", "text": json.dumps(message)})
+            incoming.put_nowait({"type": "websocket.disconnect"})
+            sent = []
+
+            async def send(event):
+                await asyncio.sleep(0)  # let subscription tasks start between messages
+                sent.append(event)
+
+            scope = {"type": "websocket", "subprotocols": [PROTOCOL]}
+            await GraphQLWebSocketApp(get_schema())(scope, incoming.get, send)
+            return [json.loads(e["text"]) if "text" in e else e for e in sent[1:]]  # skip the accept
+
+        return asyncio.run(run())
+
+    def test_subscribe_before_connection_init_closes_4401(self):
+        self.assertEqual(self.converse(self.subscribe), [{"type": "websocket.close", "code": 4401,
+                                                          "reason": "Unauthorized"}])
+
+    def test_reused_operation_id_closes_4409(self):
+        sent = self.converse({"type": "connection_init"}, self.subscribe, self.subscribe)
+        self.assertEqual(sent[0], {"type": "connection_ack"})
+        self.assertEqual((sent[-1]["code"], sent[-1]["reason"]), (4409, "Subscriber for 1 already exists"))
+
+    def test_second_connection_init_closes_4429(self):
+        sent = self.converse({"type": "connection_init"}, {"type": "connection_init"})
+        self.assertEqual(sent[-1]["code"], 4429)
+
+
+class IdempotencyKeyTests(QueryCountTestCase):
+    create_order = (
+        "mutation($c: ID!, $p: [ID]!, $k: String) { createOrder(idempotencyKey: $k, "
+        "input: {customerId: $c, productIds: $p}) { order { id } errors replayed } }"
+    )
+
+    def test_retry_returns_stored_order_without_running_again(self):
+        customer, product = make_customers(1)[0], make_products(1)[0]
+        variables = {"c": customer.pk, "p": [product.pk], "k": "retry-1"}
+
+        first = self.execute(self.create_order, variables)["createOrder"]
+        second = self.execute(self.create_order, variables)["createOrder"]
+
+        self.assertEqual(first["order"], second["order"])
+        self.assertEqual((first["replayed"], second["replayed"]), (False, True))
+        self.assertEqual(Order.objects.count(), 1)
+        customer.refresh_from_db()
+        self.assertEqual(customer.order_count, 1)
+
+    def test_key_reuse_with_different_payload_is_rejected(self):
+        customer, products = make_customers(1)[0], make_products(2)
+        self.execute(self.create_order, {"c": customer.pk, "p": [products[0].pk], "k": "retry-2"})
+        result = self.execute(self.create_order, {"c": customer.pk, "p": [products[1].pk], "k": "retry-2"})
+
+        self.assertIsNone(result["createOrder"]["order"])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_claim_left_by_a_dead_request_is_taken_over_after_its_lease(self):
+        from django.utils import timezone
+
+        from .idempotency import IdempotencyError, fingerprint, run_idempotent
+        from .models import IdempotencyRecord
+
+        now = timezone.now()
+        record = IdempotencyRecord.objects.create(
+            key="dead-1", operation="op", request_hash=fingerprint("op", {}),
+            expires_at=now + timedelta(days=1), locked_until=now + timedelta(seconds=30),
+        )
+        with self.assertRaises(IdempotencyError):  # the lease is still live
+            run_idempotent("dead-1", "op", {}, lambda: ("ran", {}), wait_timeout=0.1)
+
+        IdempotencyRecord.objects.filter(pk=record.pk).update(locked_until=now - timedelta(seconds=1))
+        self.assertEqual(run_idempotent("dead-1", "op", {}, lambda: ("ran", {"n": 1})), ("ran", {"n": 1}, False))
+        self.assertEqual(IdempotencyRecord.objects.get(key="dead-1").response, {"n": 1})
+
+    def test_claim_is_retried_when_the_holder_releases_the_key_mid_claim(self):
+        from django.db import IntegrityError
+
+        from .idempotency import run_idempotent
+        from .models import IdempotencyRecord
+
+        create, attempts = IdempotencyRecord.objects.create, []
+
+        def create_after_holder_left(**kwargs):
+            attempts.append(kwargs["key"])
+            if len(attempts) == 1:
+                raise IntegrityError("held by a request that has since failed and deleted its record")
+            return create(**kwargs)
+
+        with mock.patch.object(IdempotencyRecord.objects, "create", create_after_holder_left):
+            result = run_idempotent("gone-1", "op", {}, lambda: ("ran", {}))
+        self.assertEqual((result, len(attempts)), (("ran", {}, False), 2))
+
+
+class IdempotencyLeaseTests(TransactionTestCase):
+    def test_lease_is_renewed_while_a_slow_mutation_runs(self):
+        from django.utils import timezone
+
+        from .idempotency import _claim, fingerprint, run_idempotent
+        from .models import IdempotencyRecord
+
+        def claim_from_another_worker():
+            try:
+                return _claim("slow-1", "op", fingerprint("op", {}))
+            finally:
+                connection.close()
+
+        def slow():
+            time.sleep(1)  # several leases long
+            self.assertGreater(IdempotencyRecord.objects.get(key="slow-1").locked_until, timezone.now())
+            with ThreadPoolExecutor(1) as pool:
+                _, claimed = pool.submit(claim_from_another_worker).result()
+            self.assertFalse(claimed)  # a retry elsewhere waits instead of running it again
+            return "ran", {}
+
+        with self.settings(CRM_IDEMPOTENCY_LEASE=0.3):
+            self.assertEqual(run_idempotent("slow-1", "op", {}, slow), ("ran", {}, False))
+
+
+class OrderArchiveTests(QueryCountTestCase):
+    query = "query($archived: Boolean) { orders(includeArchived: $archived) { totalCount edges { node { id products { id } } } } }"
+
+    def test_archived_orders_are_moved_and_reachable_on_request(self):
+        make_archived_orders(5)
+
+        self.assertEqual((Order.objects.count(), ArchivedOrder.objects.count()), (2, 3))
+        self.assertEqual(Order.products.through.objects.count(), 2 * 3)
+        self.assertEqual(self.execute(self.query)["orders"]["totalCount"], 2)
+
+        orders = self.execute(self.query, {"archived": True})["orders"]
+        self.assertEqual(orders["totalCount"], 5)
+        self.assertEqual([len(edge["node"]["products"]) for edge in orders["edges"]], [3] * 5)
+
+    def test_order_whose_id_is_taken_by_another_archived_order_stays_live(self):
+        customers = make_orders(3)
+        orders = list(Order.objects.order_by("pk"))
+        Order.objects.update(order_date=cutoff() - timedelta(days=1))
+        orders[0].refresh_from_db()
+        # Same order already copied (e.g. restored from a backup), and an unrelated archived order reusing an ID.
+        ArchivedOrder.objects.create(id=orders[0].pk, customer=customers[0], total_amount=orders[0].total_amount,
+                                     order_date=orders[0].order_date)
+        ArchivedOrder.objects.create(id=orders[1].pk, customer=customers[2], total_amount=Decimal("1.00"),
+                                     order_date=cutoff() - timedelta(days=400))
+
+        with self.assertLogs("crm.archive", "WARNING"):
+            self.assertEqual(sum(archive_range(cutoff())), 2)
+        self.assertEqual(list(Order.objects.values_list("pk", flat=True)), [orders[1].pk])
+        self.assertEqual(ArchivedOrder.objects.get(pk=orders[1].pk).total_amount, Decimal("1.00"))
+        self.assertEqual(ArchivedOrder.products.through.objects.filter(archivedorder_id=orders[0].pk).count(), 3)
+        self.assertEqual(Order.products.through.objects.filter(order_id=orders[1].pk).count(), 3)
+
+
+class JobRunLogTests(FlushJobLogMixin, TestCase):
+    def test_buffered_runs_are_written_in_one_insert(self):
+        log = JobRunLog(buffer_size=50)
+        with self.assertNumQueries(1):
+            make_job_runs(30, log=log)
+        self.assertEqual(JobRun.objects.count(), 30)
+        self.assertEqual(JobRun.objects.filter(status=JobRun.FAILED).count(), 10)
+
+    def test_worker_process_shutdown_flushes_pending_runs(self):
+        from celery.signals import worker_process_shutdown
+
+        joblog.record(RunRecord("update_low_stock"))
+        self.assertFalse(JobRun.objects.exists())
+        worker_process_shutdown.send(sender=None, pid=1, exitcode=0)
+        self.assertEqual(JobRun.objects.count(), 1)
+
+
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        catalog.reset()
+        self.addCleanup(catalog.reset)
+
+    def test_prices_served_from_snapshot_and_kept_current_on_commit(self):
+        products = make_products(3)
+        ids = [p.pk for p in products]
+        catalog.product_prices(ids)  # loads the snapshot
+        with self.assertNumQueries(0):
+            self.assertEqual(catalog.product_prices(ids)[ids[0]], (Decimal("9.99"), 50))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            products[0].price = Decimal("12.50")
+            products[0].save()
+            products[1].delete()
+        with self.assertNumQueries(1):  # the deleted ID is looked up in the database
+            prices = catalog.product_prices(ids)
+        self.assertEqual(prices[ids[0]], (Decimal("12.50"), 50))
+        self.assertNotIn(ids[1], prices)
+
+    def test_memory_budget_bounds_snapshot(self):
+        ids = [p.pk for p in make_products(10)]
+        snapshot = catalog.CatalogSnapshot(max_bytes=4 * catalog.ENTRY_BYTES)
+        snapshot.load()
+        self.assertEqual(len(snapshot), 4)
+        self.assertFalse(snapshot.complete)
+        found, missing = snapshot.lookup(ids)
+        self.assertEqual((sorted(found), missing), (ids[:4], ids[4:]))
+
+
+class HealthTests(TestCase):
+    def test_healthz_reuses_cached_database_probe(self):
+        self.client.get("/healthz")
+        with self.assertNumQueries(0):
+            response = self.client.get("/healthz")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["database"]["ok"])
+
+    def test_latency_alert_against_recent_median(self):
+        history = [10.0, 12.0, 11.0, 9.0, 10.0, 13.0]
+        self.assertIsNone(latency_alert(history, 25.0))
+        self.assertIsNotNone(latency_alert(history, 40.0))
+        self.assertIsNone(latency_alert(history[:3], 400.0))
+
+
+class FastPathTests(TestCase):
+    def post(self, query, variables=None, fast=True):
+        request = RequestFactory().post(
+            "/graphql", json.dumps({"query": query, "variables": variables}), content_type="application/json"
+        )
+        with self.settings(CRM_GRAPHQL_FAST_PATH=fast):
+            response = CRMGraphQLView.as_view(schema=get_schema())(request)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_scalar_list_matches_graphene_output(self):
+        make_orders(12)
+        query = """query($min: Decimal) {
+            list: orders(first: 5, totalAmount_Gte: $min) {
+                totalCount totalRevenue pageInfo { hasNextPage endCursor }
+                edges { cursor node { __typename id totalAmount orderDate } }
+            }
+        }"""
+        schema = get_schema()
+        self.assertIsNotNone(fastpath.execute(schema, query, {"min": "1"}))
+        with self.assertNumQueries(3):  # count, revenue, rows
+            fast = self.post(query, {"min": "1"})
+        self.assertEqual(fast, self.post(query, {"min": "1"}, fast=False))
+        self.assertEqual(len(fast["data"]["list"]["edges"]), 5)
+
+    def test_pages_above_graphenes_default_limit_are_served(self):
+        make_products(150)
+        query = "query($n: Int) { products(first: $n) { edges { node { id name } } } }"
+        self.assertIsNotNone(fastpath.execute(get_schema(), query, {"n": 150}))
+        fast = self.post(query, {"n": 150})
+        self.assertEqual(len(fast["data"]["products"]["edges"]), 150)
+        self.assertEqual(fast, self.post(query, {"n": 150}, fast=False))
+
+        # Without `first`, both paths still return graphene's default page.
+        unpaged = "{ products { edges { node { id } } } }"
+        self.assertEqual(len(self.post(unpaged)["data"]["products"]["edges"]), 100)
+        self.assertEqual(self.post(unpaged), self.post(unpaged, fast=False))
+
+    def test_nested_or_paged_selections_fall_back(self):
+        schema = get_schema()
+        for query in (
+            "{ orders(first: 5) { edges { node { id customer { name } } } } }",
+            '{ orders(first: 5, after: "YXJyYXljb25uZWN0aW9uOjQ=") { edges { node { id } } } }',
+            "{ orders(includeArchived: true) { edges { node { id } } } }",
+            "{ products { edges { node { ...P } } } } fragment P on ProductType { id }",
+        ):
+            self.assertIsNone(fastpath.execute(schema, query), query)
+
+
+class IncrementalDeliveryTests(TestCase):
+    query = """{
+        orders(first: 10) {
+            totalCount
+            edges @stream(initialCount: 2) { node { id ... @defer(label: "lines") { products { name } } } }
+        }
+    }"""
+
+    def post(self, accept, query=None):
+        return self.client.post(
+            "/graphql", json.dumps({"query": query or self.query}), content_type="application/json", HTTP_ACCEPT=accept
+        )
+
+    def payloads(self, response):
+        return self.parts(b"".join(response.streaming_content))
+
+    def parts(self, body):
+        self.assertTrue(body.endswith(incremental.CLOSE_DELIMITER))
+        body = body[:-len(incremental.CLOSE_DELIMITER)]
+        return [json.loads(part) for part in body.split(incremental.PART_HEADER)[1:]]
+
+    def merge(self, payloads):
+        data = payloads[0]["data"]
+        self.assertEqual(len(data["orders"]["edges"]), 2)
+        for payload in payloads[1:]:
+            for entry in payload["incremental"]:
+                if "items" in entry:
+                    self.assertEqual(entry["path"], ["orders", "edges", len(data["orders"]["edges"])])
+                    data["orders"]["edges"].extend(entry["items"])
+                else:
+                    _, _, index, _ = entry["path"]
+                    data["orders"]["edges"][index]["node"].update(entry["data"])
+        self.assertEqual([p["hasNext"] for p in payloads], [True] * (len(payloads) - 1) + [False])
+        return data
+
+    def test_streamed_rows_and_deferred_fields_add_up_to_the_normal_response(self):
+        make_orders(12)
+        # Count, cursor, then one products prefetch per batch of rows: 2 initial + 3 + 3 + 2.
+        with self.settings(CRM_GRAPHQL_STREAM_BATCH=3), self.assertNumQueries(2 + 4):
+            response = self.post("multipart/mixed, application/json")
+            self.assertEqual(response["Content-Type"], incremental.CONTENT_TYPE)
+            payloads = self.payloads(response)
+
+        self.assertEqual({e["label"] for p in payloads[1:] for e in p["incremental"] if "data" in e}, {"lines"})
+        self.assertEqual(self.merge(payloads), self.post("application/json").json()["data"])
+
+    def test_stream_longer_than_graphenes_default_limit(self):
+        make_orders(150)
+        query = self.query.replace("orders(first: 10)", "orders(first: 150)")
+        payloads = self.payloads(self.post("multipart/mixed", query))
+        self.assertNotIn("errors", payloads[0])
+        data = self.merge(payloads)
+        self.assertEqual(len(data["orders"]["edges"]), 150)
+        self.assertEqual(data, self.post("application/json", query).json()["data"])
+
+    async def test_stream_is_sent_incrementally_under_asgi(self):
+        await sync_to_async(make_orders)(12)
+        with self.settings(CRM_GRAPHQL_STREAM_BATCH=3):
+            response = await self.async_client.post(
+                "/graphql", {"query": self.query}, content_type="application/json", headers={"Accept": "multipart/mixed"}
+            )
+            self.assertTrue(response.is_async)  # a sync body would be read whole before sending
+            chunks = [chunk async for chunk in response.streaming_content]
+        payloads = self.parts(b"".join(chunks))
+        self.assertEqual(len(chunks), len(payloads) + 1)  # one chunk per part, then the close delimiter
+        self.assertEqual(len(self.merge(payloads)["orders"]["edges"]), 10)
+        await sync_to_async(response.close)()
+        self.assertEqual(sum(get_store()._inflight.values()), 0)
+
+    def test_archived_orders_stream_in_batches_from_both_tables(self):
+        make_archived_orders(12)  # 6 live, then 6 archived
+        query = self.query.replace("orders(first: 10)", "orders(includeArchived: true)")
+        # Two counts, a cursor per table, then a products prefetch per table per batch:
+        # 2 initial, 3, 3 (1 live + 2 archived), 3, 1.
+        with self.settings(CRM_GRAPHQL_STREAM_BATCH=3), self.assertNumQueries(4 + 6):
+            payloads = self.payloads(self.post("multipart/mixed", query))
+        self.assertEqual(self.merge(payloads), self.post("application/json", query).json()["data"])
+
+    def test_failure_mid_stream_ends_with_an_error_payload(self):
+        make_orders(3)
+        with mock.patch.object(incremental.Delivery, "deferred_payload", side_effect=RuntimeError("lost the cursor")):
+            with self.assertLogs("crm.incremental", "ERROR"):
+                payloads = self.payloads(self.post("multipart/mixed"))
+        self.assertEqual(len(payloads[0]["data"]["orders"]["edges"]), 2)
+        self.assertEqual(payloads[-1], {"errors": [{"message": "lost the cursor"}], "hasNext": False})
+
+    def test_stream_holds_its_concurrency_slot_until_closed(self):
+        make_orders(3)
+        store = get_store()
+        response = self.post("multipart/mixed")
+        self.assertEqual(sum(store._inflight.values()), 1)
+        response.close()
+        self.assertEqual(sum(store._inflight.values()), 0)
+
+
+class RateLimitTests(TestCase):
+    limits = {"query": {"rate": 0.001, "burst": 3}, "concurrency": 2}
+
+    def post(self, body, client, raw=False, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        return self.client.post(
+            "/graphql", body if raw else json.dumps(body), HTTP_X_API_KEY=client, REMOTE_ADDR="10.0.0.1", **kwargs
+        )
+
+    def setUp(self):
+        patcher = mock.patch.object(get_store(), "_buckets", {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        api_keys = self.settings(CRM_API_KEYS=["rl-bucket", "rl-busy"] + [f"rl-malformed-{i}" for i in range(5)])
+        api_keys.enable()
+        self.addCleanup(api_keys.disable)
+
+    def test_cost_is_charged_and_reported_until_the_bucket_is_empty(self):
+        query = "query($n: Int) { products(first: $n) { edges { node { id } } } }"
+        with self.settings(CRM_RATE_LIMITS={**self.limits, "cost_unit": 10}):
+            response = self.post({"query": query, "variables": {"n": 5}}, "rl-bucket")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                (response["X-RateLimit-Limit"], response["X-RateLimit-Remaining"], response["X-RateLimit-Cost"]),
+                ("3", "1", "2"),
+            )
+            response = self.post({"query": query, "variables": {"n": 5}}, "rl-bucket")
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual((response["X-RateLimit-Limit"], response["X-RateLimit-Remaining"]), ("3", "0"))
+        retry_after = int(response["Retry-After"])
+        self.assertGreaterEqual(retry_after, 1)
+        error = response.json()["errors"][0]
+        self.assertEqual(error["extensions"], {"code": "RATE_LIMITED", "retryAfter": retry_after})
+
+    def test_unknown_api_keys_share_the_address_bucket(self):
+        with self.settings(CRM_RATE_LIMITS=self.limits):
+            statuses = [self.post({"query": "{ hello }"}, f"rl-invented-{i}").status_code for i in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+
+    def test_query_in_the_url_or_a_graphql_body_is_costed(self):
+        query = "{ products(first: 100) { edges { node { id } } } }"
+        with self.settings(CRM_RATE_LIMITS=self.limits):
+            in_url = self.client.post(f"/graphql?query={query}", "{}", content_type="application/json",
+                                      HTTP_X_API_KEY="rl-bucket")
+            as_graphql = self.post(query, "rl-busy", raw=True, content_type="application/graphql")
+        self.assertEqual((in_url.status_code, in_url["X-RateLimit-Cost"]), (200, "3"))
+        self.assertEqual((as_graphql.status_code, as_graphql["X-RateLimit-Cost"]), (200, "3"))
+
+    def test_refilled_buckets_are_evicted(self):
+        store = get_store()
+        clock = mock.patch("crm.ratelimit.time.monotonic", return_value=1000.0)
+        with clock as now, mock.patch.object(store, "_next_sweep", 1000.0 + store.sweep_interval):
+            store.consume("ip:idle", 1, rate=1.0, burst=5)
+            store.consume("ip:drained", 5, rate=0.001, burst=5)
+            now.return_value += store.sweep_interval
+            store.consume("ip:new", 1, rate=1.0, burst=5)
+        self.assertEqual(set(store._buckets), {"ip:drained", "ip:new"})
+
+    def test_concurrency_cap_rejects_before_charging(self):
+        store = get_store()
+        for _ in range(2):
+            store.acquire("key:rl-busy", 2)
+        self.addCleanup(lambda: [store.release("key:rl-busy") for _ in range(2)])
+        with self.settings(CRM_RATE_LIMITS=self.limits):
+            response = self.post({"query": "{ hello }"}, "rl-busy")
+        self.assertEqual((response.status_code, response["Retry-After"]), (429, "1"))
+
+    def test_malformed_bodies_are_estimated_not_crashed_on(self):
+        query = "query($n: Int) { products(first: $n) { edges { node { id } } } }"
+        request = RequestFactory().post(
+            "/graphql", json.dumps({"query": query, "variables": json.dumps({"n": 5})}), content_type="application/json"
+        )
+        self.assertEqual(graphql_params(request), (query, {"n": 5}, None))
+
+        with self.settings(CRM_RATE_LIMITS=self.limits):
+            for i, body in enumerate(('"{ hello }"', "5", '["{ hello }"]', '{"query": "{ hello }", "variables": "[1]"}',
+                                      '{"query": 5, "variables": "not json"}')):
+                response = self.post(body, f"rl-malformed-{i}", raw=True)
+                self.assertIn(response.status_code, (200, 400), body)
+                self.assertEqual(response["X-RateLimit-Cost"], "1", body)
+
+
+class QueryCountCoverageTests(TestCase):
+    """Every root field must have a guard above; add one when adding an operation."""
+
+    guarded = {
+        "Query": {"hello", "customers", "products", "orders", "job", "jobRuns", "jobRunTrends"},
+        "Mutation": {"createCustomer", "bulkCreateCustomers", "createProduct", "createOrder",
+                     "updateLowStockProducts"},
+    }
+
+    def test_every_operation_is_guarded(self):
+        schema = get_schema().graphql_schema
+        for type_name, guarded in self.guarded.items():
+            fields = set(schema.get_type(type_name).fields)
+            self.assertEqual(fields - guarded, set(), f"{type_name} fields without a query-count guard")
@@ -0,0 +1,202 @@
+"""
+Batch validation for customer and product payloads.
+
+Rules are compiled once at import time and applied to a whole batch in a
+single pass; uniqueness is checked with one set-based query per chunk
+instead of an ``exists()`` per row. The same validators back the GraphQL
+mutations, the ``import_crm`` command and the Celery bulk jobs.
+"""
+import re
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.validators import EmailValidator
+from django.db.models.functions import Lower
+
+from .models import Customer, Product
+
+PHONE_RE = re.compile(r"^(\+\d{7,15}|\d{3}-\d{3}-\d{4})$")
+validate_email = EmailValidator()
+MAX_PRICE = Decimal("99999999.99")  # Product.price max_digits=10, decimal_places=2
+CENTS = Decimal("0.01")
+
+# SQLite limits bound parameters per statement; stay well under it.
+LOOKUP_CHUNK = 500
+
+
+@dataclass
+class RowError:
+    row: int
+    field: str
+    message: str
+    value: object = None
+
+    def __str__(self):
+        if self.value is None or not str(self.value).strip():
+            return f"[{self.row}] {self.message}"
+        return f"[{self.row}] {self.message}: {self.value}"
+
+
+@dataclass
+class ValidationResult:
+    valid: list = field(default_factory=list)    # (row number, cleaned dict)
+    errors: list = field(default_factory=list)   # RowError
+
+    @property
+    def cleaned(self):
+        return [data for _, data in self.valid]
+
+
+# ------------------------
+# Field cleaners: return the cleaned value or raise ValueError(message);
+# "{field}" in a message is replaced with the field name.
+# ------------------------
+def clean_text(value):
+    value = (value or "").strip()
+    if not value:
+        raise ValueError("{field} is required")
+    return value
+
+
+def clean_optional_text(value):
+    return (value or "").strip() or None
+
+
+def clean_email(value):
+    value = clean_text(value)
+    try:
+        validate_email(value)
+    except ValidationError:
+        raise ValueError("Invalid email address")
+    return value
+
+
+def clean_phone(value):
+    value = clean_optional_text(value)
+    if value is not None and not PHONE_RE.match(value):
+        raise ValueError("Invalid phone format (use +1234567890 or 123-456-7890)")
+    return value
+
+
+def clean_price(value):
+    try:
+        price = Decimal(str(value)).quantize(CENTS)
+    except (InvalidOperation, ValueError, TypeError):
+        raise ValueError("Invalid price format")
+    if price <= 0:
+        raise ValueError("Price must be positive")
+    if price > MAX_PRICE:
+        raise ValueError("Price is too large")
+    return price
+
+
+def clean_stock(value):
+    if value in (None, ""):
+        return 0
+    try:
+        stock = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid stock value")
+    if stock < 0:
+        raise ValueError("Stock cannot be negative")
+    return stock
+
+
+# ------------------------
+# Validators
+# ------------------------
+class BatchValidator:
+    """
+    ``fields`` maps field name -> cleaner. ``unique`` names case-insensitive
+    unique fields checked both within the batch and against ``model``.
+    ``required`` names the fields ``precheck`` looks for.
+    """
+
+    def __init__(self, model, fields, unique=(), required=()):
+        self.model = model
+        self.fields = tuple(fields.items())
+        self.unique = tuple(unique)
+        self.required = tuple(required)
+
+    def precheck(self, rows, max_rows=None, start=1):
+        """
+        Cheap checks before a batch is queued as a job: the row count and that
+        required fields are present. No cleaning and no database access.
+        """
+        if max_rows is not None and len(rows) > max_rows:
+            return [RowError(0, "input", f"Too many rows: {len(rows)} (at most {max_rows} per job)")]
+        errors = []
+        for idx, row in enumerate(rows, start=start):
+            for name in self.required:
+                value = row.get(name)
+                if value is None or not str(value).strip():
+                    errors.append(RowError(idx, name, f"{name.title()} is required"))
+        return errors
+
+    def validate(self, rows, start=1):
+        result = ValidationResult()
+        candidates = []
+        for idx, row in enumerate(rows, start=start):
+            get = row.get if isinstance(row, dict) else (lambda name, _row=row: getattr(_row, name, None))
+            cleaned, row_errors = {}, []
+            for name, cleaner in self.fields:
+                raw = get(name)
+                try:
+                    cleaned[name] = cleaner(raw)
+                except ValueError as e:
+                    row_errors.append(RowError(idx, name, str(e).format(field=name.title()), raw))
+            if row_errors:
+                result.errors.extend(row_errors)
+            else:
+                candidates.append((idx, cleaned))
+
+        for name in self.unique:
+            candidates = self._check_unique(name, candidates, result.errors)
+
+        result.valid = candidates
+        result.errors.sort(key=lambda e: e.row)
+        return result
+
+    def _check_unique(self, name, candidates, errors):
+        keys = {cleaned[name].lower() for _, cleaned in candidates}
+        taken = self.existing(name, keys)
+
+        kept, seen = [], set()
+        for idx, cleaned in candidates:
+            key = cleaned[name].lower()
+            if key in taken:
+                errors.append(RowError(idx, name, f"{name.title()} already exists", cleaned[name]))
+            elif key in seen:
+                errors.append(RowError(idx, name, f"Duplicate {name} in batch", cleaned[name]))
+            else:
+                seen.add(key)
+                kept.append((idx, cleaned))
+        return kept
+
+    def existing(self, name, keys):
+        """Lower-cased values of ``name`` already stored, for the given lower-cased keys."""
+        keys = list(keys)
+        taken = set()
+        for offset in range(0, len(keys), LOOKUP_CHUNK):
+            chunk = keys[offset:offset + LOOKUP_CHUNK]
+            taken.update(
+                self.model.objects.annotate(_key=Lower(name))
+                .filter(_key__in=chunk)
+                .values_list("_key", flat=True)
+            )
+        return taken
+
+
+customer_validator = BatchValidator(
+    Customer,
+    {"name": clean_text, "email": clean_email, "phone": clean_phone},
+    unique=("email",),
+    required=("name", "email"),
+)
+
+product_validator = BatchValidator(
+    Product,
+    {"name": clean_text, "price": clean_price, "stock": clean_stock},
+    required=("name", "price"),
+)
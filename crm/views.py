@@ -1,3 +1,124 @@
-from django.shortcuts import render
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.core.exceptions import ValidationError
+from django.views.decorators.http import require_GET
+from graphene_django.views import GraphQLView, HttpError
 
-# Create your views here.
+from . import fastpath, incremental
+from .exports import CONTENT_TYPES, STREAM_WRITERS, export_rows
+from .health import liveness, readiness
+
+
+class AsyncChunks:
+    """
+    Async iterator over a sync chunk generator. Under ASGI, Django reads a sync
+    streaming body completely (``sync_to_async(list)``) before sending any of
+    it. This class produces one chunk per ``next()`` call on Django's sync
+    thread instead, so the ORM cursors behind the chunks stay on one
+    connection.
+    """
+
+    _done = object()
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await sync_to_async(next)(self.chunks, self._done)
+        if chunk is self._done:
+            raise StopAsyncIteration
+        return chunk
+
+    def close(self):
+        # Called from Django's sync thread when the response is closed, e.g. after a disconnect.
+        close = getattr(self.chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def streaming_response(request, chunks, **kwargs):
+    """A StreamingHttpResponse that streams under both WSGI and ASGI."""
+    if isinstance(request, ASGIRequest):
+        chunks = AsyncChunks(chunks)
+    return StreamingHttpResponse(chunks, **kwargs)
+
+
+@require_GET
+def export(request, resource):
+    """
+    Stream a filtered table as CSV or NDJSON, e.g.
+    ``/export/orders?format=ndjson&order_date__gte=2025-01-01``.
+    Remaining query parameters are passed to the resource's FilterSet.
+    """
+    params = request.GET.copy()
+    fmt = params.pop("format", ["csv"])[-1]
+    if fmt not in STREAM_WRITERS:
+        return HttpResponseBadRequest(f"Unsupported format: {fmt}")
+
+    try:
+        columns, rows = export_rows(resource, params)
+    except ValidationError as e:
+        return HttpResponseBadRequest("; ".join(e.messages))
+
+    response = streaming_response(request, STREAM_WRITERS[fmt](columns, rows), content_type=CONTENT_TYPES[fmt])
+    response["Content-Disposition"] = f'attachment; filename="{resource}.{fmt}"'
+    return response
+
+
+@require_GET
+def healthz(request):
+    """Liveness: 200 while the database answers (probe cached for a few seconds), else 503."""
+    report = liveness()
+    return JsonResponse(report, status=200 if report["status"] == "ok" else 503)
+
+
+@require_GET
+def readyz(request):
+    """Readiness: DB latency, cache round trip and Celery queue depth; 503 if any check fails."""
+    report = readiness()
+    return JsonResponse(report, status=200 if report["status"] == "ready" else 503)
+
+
+class CRMGraphQLView(GraphQLView):
+    """
+    ``GraphQLView`` that answers large scalar-only list queries through
+    ``crm.fastpath``, streams ``@defer``/``@stream`` listings to clients that
+    accept ``multipart/mixed`` through ``crm.incremental``, and everything
+    else through graphene as usual. ``CRM_GRAPHQL_FAST_PATH = False`` turns
+    the fast path off.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        payloads = self.incremental_payloads(request)
+        if payloads is not None:
+            return streaming_response(request, incremental.multipart(payloads), content_type=incremental.CONTENT_TYPE)
+        return super().dispatch(request, *args, **kwargs)
+
+    def incremental_payloads(self, request):
+        if self.batch or request.method not in ("GET", "POST") or not incremental.accepts_multipart(request):
+            return None
+        try:
+            data = self.parse_body(request)
+            query, variables, operation_name, _ = self.get_graphql_params(request, data)
+        except HttpError:
+            return None  # reported by GraphQLView.dispatch
+        return incremental.execute(self.schema, query, variables, operation_name, context=request)
+
+    def get_response(self, request, data, show_graphiql=False):
+        if self.use_fast_path(request, show_graphiql):
+            query, variables, operation_name, _ = self.get_graphql_params(request, data)
+            body = fastpath.execute(self.schema, query, variables, operation_name, context=request)
+            if body is not None:
+                return body, 200
+        return super().get_response(request, data, show_graphiql)
+
+    def use_fast_path(self, request, show_graphiql=False):
+        if not getattr(settings, "CRM_GRAPHQL_FAST_PATH", True):
+            return False
+        # Batched and pretty-printed responses keep the normal encoder.
+        return not (show_graphiql or self.batch or self.pretty or request.GET.get("pretty"))
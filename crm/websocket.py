@@ -0,0 +1,102 @@
+"""
+Minimal ASGI WebSocket handler serving GraphQL subscriptions using the
+``graphql-transport-ws`` protocol (the one spoken by graphql-ws / Apollo).
+"""
+import asyncio
+import json
+
+from graphql import ExecutionResult
+
+PROTOCOL = "graphql-transport-ws"
+
+
+class GraphQLWebSocketApp:
+    def __init__(self, schema=None):
+        self._schema = schema
+
+    @property
+    def schema(self):
+        if self._schema is None:
+            from graphene_django.settings import graphene_settings
+
+            self._schema = graphene_settings.SCHEMA
+        return self._schema
+
+    async def __call__(self, scope, receive, send):
+        lock = asyncio.Lock()
+        operations = {}
+        state = {"initialized": False}
+
+        async def send_json(message):
+            async with lock:
+                await send({"type": "websocket.send", "text": json.dumps(message)})
+
+        try:
+            while True:
+                event = await receive()
+                if event["type"] == "websocket.connect":
+                    if PROTOCOL not in scope.get("subprotocols", []):
+                        await send({"type": "websocket.close", "code": 4406})
+                        return
+                    await send({"type": "websocket.accept", "subprotocol": PROTOCOL})
+                elif event["type"] == "websocket.disconnect":
+                    return
+                elif event["type"] == "websocket.receive":
+                    raw = event.get("text") or (event.get("bytes") or b"").decode()
+                    try:
+                        message = json.loads(raw)
+                    except ValueError:
+                        await send({"type": "websocket.close", "code": 4400})
+                        return
+                    close = await self.handle_message(message, send_json, operations, state)
+                    if close is not None:
+                        code, reason = close
+                        await send({"type": "websocket.close", "code": code, "reason": reason})
+                        return
+        finally:
+            for task in operations.values():
+                task.cancel()
+
+    async def handle_message(self, message, send_json, operations, state):
+        """Handle one client message; returns ``(code, reason)`` when the protocol requires closing the socket."""
+        kind = message.get("type")
+        if kind == "connection_init":
+            if state["initialized"]:
+                return 4429, "Too many initialisation requests"
+            state["initialized"] = True
+            await send_json({"type": "connection_ack"})
+        elif kind == "ping":
+            await send_json({"type": "pong"})
+        elif kind == "subscribe":
+            if not state["initialized"]:
+                return 4401, "Unauthorized"
+            op_id = message["id"]
+            if op_id in operations:
+                return 4409, f"Subscriber for {op_id} already exists"
+            task = asyncio.ensure_future(self.run_operation(op_id, message.get("payload") or {}, send_json))
+            operations[op_id] = task
+            task.add_done_callback(lambda _t: operations.pop(op_id, None))
+        elif kind == "complete":
+            task = operations.pop(message.get("id"), None)
+            if task is not None:
+                task.cancel()
+
+    async def run_operation(self, op_id, payload, send_json):
+        result = await self.schema.subscribe(
+            payload.get("query", ""),
+            variables=payload.get("variables"),
+            operation_name=payload.get("operationName"),
+        )
+        if isinstance(result, ExecutionResult):
+            # Validation/parse errors, or a query/mutation sent over the socket.
+            if result.errors:
+                await send_json({"type": "error", "id": op_id, "payload": result.formatted["errors"]})
+                return
+            await send_json({"type": "next", "id": op_id, "payload": result.formatted})
+        else:
+            try:
+                async for item in result:
+                    await send_json({"type": "next", "id": op_id, "payload": item.formatted})
+            finally:
+                await result.aclose()
+        await send_json({"type": "complete", "id": op_id})
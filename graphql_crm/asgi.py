@@ -2,6 +2,8 @@
 ASGI config for alx_backend_graphql_crm project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests are served by Django; WebSocket connections carry GraphQL
+subscriptions (``orderCreated``, ``productStockChanged``).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +15,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from crm.websocket import GraphQLWebSocketApp  # noqa: E402  (needs apps loaded)
+
+websocket_application = GraphQLWebSocketApp()
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "websocket":
+        return await websocket_application(scope, receive, send)
+    return await django_application(scope, receive, send)
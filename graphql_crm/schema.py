@@ -1,10 +1,39 @@
+from functools import lru_cache
+
 import graphene
-from crm.schema import Query as CRMQuery, Mutation as CRMMutation
 
-class Query(CRMQuery, graphene.ObjectType):
-    pass
 
-class Mutation(CRMMutation, graphene.ObjectType):
-    pass
+@lru_cache(maxsize=None)
+def get_schema():
+    """
+    Build the project schema once per process, on first use.
+
+    Processes that never serve GraphQL (cron jobs, most Celery workers,
+    management commands) don't pay for importing crm.schema or building it.
+    """
+    from graphql import specified_directives
+
+    from crm.incremental import DIRECTIVES
+    from crm.schema import Query as CRMQuery, Mutation as CRMMutation, Subscription as CRMSubscription
+
+    class Query(CRMQuery, graphene.ObjectType):
+        pass
+
+    class Mutation(CRMMutation, graphene.ObjectType):
+        pass
+
+    class Subscription(CRMSubscription, graphene.ObjectType):
+        pass
+
+    return graphene.Schema(
+        query=Query, mutation=Mutation, subscription=Subscription,
+        # @defer/@stream are served by crm.incremental for multipart requests and ignored otherwise.
+        directives=(*specified_directives, *DIRECTIVES),
+    )
+
 
-schema = graphene.Schema(query=Query, mutation=Mutation)
+def __getattr__(name):
+    # Keeps GRAPHENE["SCHEMA"] = "<this module>.schema" working while building lazily.
+    if name == "schema":
+        return get_schema()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
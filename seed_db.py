@@ -1,10 +1,33 @@
+import argparse
+import itertools
 import os
+import random
+import secrets
+from datetime import timedelta
+from decimal import Decimal
+
 import django
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "graphql_crm.settings")  # or alx_backend_graphql_crm.settings
 django.setup()
 
-from crm.models import Customer, Product
+from django.db import transaction
+from django.utils import timezone
+
+from crm.models import Customer, Order, Product
+
+# Named data sizes for benchmarks; pass --customers etc. to override.
+SCALES = {
+    "demo": None,
+    "small": {"customers": 1_000, "products": 200, "orders_per_customer": 3.0},
+    "10k": {"customers": 10_000, "products": 1_000, "orders_per_customer": 3.0},
+    "1m": {"customers": 1_000_000, "products": 20_000, "orders_per_customer": 3.0},
+}
+
+# Products per order: most orders have one or two lines, a long tail has more.
+FAN_OUT = (1, 2, 3, 4, 5, 8)
+FAN_OUT_WEIGHTS = (40, 25, 15, 10, 7, 3)
+
 
 def run():
     Customer.objects.get_or_create(name="Demo User", email="demo@example.com", phone="+1234567890")
@@ -12,5 +35,103 @@ def run():
     Product.objects.get_or_create(name="Mouse", price="19.99", stock=100)
     print("Seeded customers and products.")
 
+
+def generate(customers, products, orders_per_customer=3.0, days=730, batch_size=5000, seed=0, verbose=True):
+    """
+    Bulk-insert a synthetic dataset: ``products`` products with Zipf-like
+    popularity, ``customers`` customers with an exponential number of orders
+    (mean ``orders_per_customer``, some with none), and order lines drawn from
+    FAN_OUT. Customer aggregates are filled in consistently.
+
+    ``seed`` fixes the shape of the data; names and emails also carry a
+    per-run tag, so generating into a database that already holds a
+    dataset adds rows instead of colliding on unique emails.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    tag = f"s{seed}-{secrets.token_hex(4)}"
+
+    product_rows = [
+        Product(
+            name=f"Product {tag}-{i}",
+            price=Decimal(rng.randint(99, 99999)) / 100,
+            stock=rng.choice((0, 3, 8, 25, 100, 500)),
+        )
+        for i in range(products)
+    ]
+    created_products = Product.objects.bulk_create(product_rows, batch_size=batch_size)
+    catalog = [(p.pk, p.price) for p in created_products]
+    popularity = list(itertools.accumulate(1 / rank for rank in range(1, len(catalog) + 1)))
+
+    Through = Order.products.through
+    total_orders = 0
+    for start in range(0, customers, batch_size):
+        count = min(batch_size, customers - start)
+        with transaction.atomic():
+            batch = Customer.objects.bulk_create([
+                Customer(
+                    name=f"Customer {start + i}",
+                    email=f"customer-{tag}-{start + i}@example.com",
+                    phone=f"+1{rng.randint(10**9, 10**10 - 1)}",
+                    created_at=now - timedelta(days=rng.uniform(0, days)),
+                )
+                for i in range(count)
+            ])
+
+            orders, lines = [], []
+            for customer in batch:
+                n_orders = int(rng.expovariate(1 / orders_per_customer)) if orders_per_customer else 0
+                for _ in range(n_orders):
+                    chosen = set(rng.choices(catalog, cum_weights=popularity,
+                                             k=rng.choices(FAN_OUT, FAN_OUT_WEIGHTS)[0]))
+                    total = sum((price for _, price in chosen), Decimal("0.00"))
+                    order_date = customer.created_at + (now - customer.created_at) * rng.random()
+                    orders.append(Order(customer=customer, total_amount=total, order_date=order_date))
+                    lines.append(chosen)
+
+                    customer.order_count += 1
+                    customer.lifetime_value += total
+                    if customer.last_order_at is None or order_date > customer.last_order_at:
+                        customer.last_order_at = order_date
+
+            created_orders = Order.objects.bulk_create(orders, batch_size=batch_size)
+            Through.objects.bulk_create(
+                [Through(order_id=o.pk, product_id=pid) for o, chosen in zip(created_orders, lines) for pid, _ in chosen],
+                batch_size=batch_size,
+            )
+            Customer.objects.bulk_update(batch, ["order_count", "lifetime_value", "last_order_at"], batch_size=batch_size)
+
+        total_orders += len(created_orders)
+        if verbose:
+            print(f"  {start + count}/{customers} customers, {total_orders} orders")
+
+    return {"customers": customers, "products": products, "orders": total_orders}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed the CRM database.")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="demo")
+    parser.add_argument("--customers", type=int)
+    parser.add_argument("--products", type=int)
+    parser.add_argument("--orders-per-customer", type=float)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    params = dict(SCALES[args.scale] or {})
+    for key in ("customers", "products", "orders_per_customer"):
+        if getattr(args, key) is not None:
+            params[key] = getattr(args, key)
+
+    if not params:
+        run()
+        return
+    params.setdefault("customers", 0)
+    params.setdefault("products", 100)
+    params.setdefault("orders_per_customer", 3.0)
+    stats = generate(batch_size=args.batch_size, seed=args.seed, **params)
+    print(f"Seeded {stats['customers']} customers, {stats['products']} products, {stats['orders']} orders.")
+
+
 if __name__ == "__main__":
-    run()
+    main()